@@ -8,4 +8,5 @@ from baserecord import BaseRecord
 
 import fields 
 
-from core import SQLiteDatabase, MemoryDatabase
+from core import SQLiteDatabase, MemoryDatabase, \
+        Index, Count, Sum, Avg, Min, Max
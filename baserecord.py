@@ -18,6 +18,10 @@ class MetaBaseRecord(type):
         # move all "*Fields" to self.fields 
         cls.base_fields = {}
 
+        # compiled sql statements, column orders and compact field classes,
+        # see SQLiteDatabase and compact_fields()
+        cls.stmt_cache = {}
+
         # queue based descent in hierachy to find all necassary fields of
         # arbitrary depth
         workqueue = [(cls, "", att) for att in cls.__dict__.keys()]
@@ -52,12 +56,24 @@ class MetaBaseRecord(type):
                         cls.setup_field(prefix + att + "__" + sub_field_key, 
                                 sub_field)
         
-        # init database instance for this class
-        cls.database = SQLiteDatabase()
+        # init database instance for this class, unless one is given as 
+        # class attribute 'database' (e.g., a MemoryDatabase)
+        cls.database = getattr(cls, "database", None) or SQLiteDatabase()
         cls.database.contribute(cls)
         
         # populate cls.objects 
         cls.objects = DataManager(cls)
+
+    def __getattr__(cls, key):
+        """
+        Access the class' fields as attributes, e.g., to build expressions:
+        Book.objects.filter(Book.pub_date > t)
+        """
+        fields = cls.__dict__.get("base_fields") or {}
+        if key in fields:
+            return fields[key]
+        raise AttributeError("'{}' has no attribute or field '{}'". \
+                format(cls.__name__, key))
             
 class BaseRecord(object):
     """Every record class has to derive from this class"""
@@ -72,15 +88,31 @@ class BaseRecord(object):
             "fieldnames starting with an underscore '_' are not allowed!"
         
         # reserved keywords, catch...
-        assert not name in ["fields", "table", "dirty"], \
+        assert not name in ["fields", "table", "dirty", "stmt_cache", 
+                "indexes", "database"], \
             "'{}' is not allowed as field name".format(name)
 
         field.name = name
         cls.base_fields[name] = field.clone()
+
+        # cached statements may not contain the new field
+        cls.stmt_cache.clear()
         
-        if hasattr(cls, name):
+        if name in cls.__dict__:
             delattr(cls, name)
 
+    @classmethod
+    def compact_fields(cls):
+        """
+        (internal) returns the (cached) list of (name, field, compact field 
+        class) for all fields, see Field::compact()
+        """
+        out = cls.stmt_cache.get("compact_fields")
+        if out is None:
+            out = cls.stmt_cache["compact_fields"] = [(name, field, 
+                field.compact(name)) for name, field in cls.base_fields.items()]
+        return out
+
     def __init__(self, **kw):
         # copy class base_fields to instance
         self.fields = {}
@@ -89,9 +121,9 @@ class BaseRecord(object):
                 ManyToManyRelation, BaseFieldGroup
 
             
-        for name, field in self.__class__.base_fields.items():
-            self.fields[name] = field.clone()
-            self.fields[name].name = name
+        # compact copies of the class fields with this obj as parent
+        for name, field, compact in self.__class__.compact_fields():
+            self.fields[name] = field.spawn(compact, self, dirty=True)
         
         # check for a non-existing passwd keyword
         for key in kw:
@@ -102,10 +134,6 @@ class BaseRecord(object):
                 raise DatabaseError("The field/keyword: '{}' was not found " + \
                                     "in the record".format(key))
 
-        # set this obj as parent for all fields
-        for name, field in self.fields.items():
-            field.parent = self
-        
         # 'dirty'-flag ... 'True' -> needs to be saved
         self.dirty = True
         
@@ -162,11 +190,13 @@ class BaseRecord(object):
                 
         # save me!!!
         ret = self.database.save_obj(self)
-        if self.database.lastrowid:
-            self.rowid = self.database.lastrowid
         self.dirty = False
         return ret
 
+    def asave(self):
+        """Same as save(), but returns the Future of the result"""
+        return self.database.submit(self.save)
+
     def destroy(self):
         """Destroy (delete) object and row in database"""
         return self.database.delete_obj(self)
@@ -183,12 +213,15 @@ class BaseRecord(object):
             
     def __repr__(self):
         """Should show the INSTANCE attributes, and omit the class/field ones"""
+        from core import QuerySet
         field_maxlen = 6
+        data = [(k, list(v) if isinstance(v, QuerySet) else v) \
+                for k, v in self]
         data = [(k,v) if not isinstance(v, list) else \
                     (k, ("<{} rowids=[{}]>". \
                         format(v and v[0].__class__.__name__, 
                                ", ".join("{}".format(x.rowid) for x in v))
-                    )) for k, v in self]
+                    )) for k, v in data]
         return "<{} {}>".format(
                 self.__class__.__name__, 
                 " ".join(("{}=<{}>".format(k, v) for k, v in data))
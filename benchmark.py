@@ -0,0 +1,90 @@
+import sys
+import time
+
+from baserecord import BaseRecord
+from fields import StringField, IntegerField, DateTimeField, \
+        FloatField, ManyToOneRelation, BaseFieldGroup
+from core import SQLiteDatabase
+
+class Point3D:
+    def __init__(self, x=None, y=None, z=None):
+        self.x = x
+        self.y = y
+        self.z = z
+
+class Point3DFieldGroup(BaseFieldGroup):
+    cls = Point3D
+    cls_ctor_args = ()
+    key2field = {
+        "x": FloatField(),
+        "y": FloatField(),
+        "z": FloatField()
+    }
+
+class Author(BaseRecord):
+    name = StringField(size=40)
+
+class Measurement(BaseRecord):
+    label = StringField(size=40)
+    num = IntegerField()
+    value = FloatField()
+    taken = DateTimeField()
+    pos = Point3DFieldGroup()
+    author = ManyToOneRelation(Author)
+
+def rate(rows, func):
+    """Return the rows per second achieved by 'func' for 'rows' rows"""
+    start = time.time()
+    func()
+    return rows / (time.time() - start)
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    db = SQLiteDatabase()
+    db.setup(":memory:")
+
+    a = Author(name="foo")
+    a.save()
+    Measurement.objects.bulk_create(Measurement(label="m{}".format(i),
+        num=i, value=i * 0.5, taken=i, pos=Point3D(i, i, i), author=a) \
+                for i in xrange(rows))
+
+    data = db.query("SELECT rowid, * FROM measurement")
+
+    def by_init():
+        for row in data:
+            db.mark_clean(Measurement(**row))
+
+    def by_loader():
+        load = db.row_loader(Measurement)
+        for row in data:
+            load(row)
+
+    def by_lazy_loader():
+        load = db.row_loader(Measurement, lazy=True)
+        for row in data:
+            load(row).num
+
+    print "rows: {}".format(rows)
+    print "hydration using BaseRecord.__init__(): {:>10.0f} rows/s". \
+            format(rate(rows, by_init))
+    print "hydration using row_loader():          {:>10.0f} rows/s". \
+            format(rate(rows, by_loader))
+    print "lazy row_loader(), reading one field:   {:>10.0f} rows/s". \
+            format(rate(rows, by_lazy_loader))
+    print "Measurement.objects.filter():          {:>10.0f} rows/s". \
+            format(rate(rows, lambda: list(Measurement.objects.filter())))
+    print "Measurement.objects.values_list():     {:>10.0f} rows/s". \
+            format(rate(rows, lambda: list(Measurement.objects.values_list())))
+
+    # a full field object keeps its keywords inside its own __dict__
+    full = Measurement.base_fields.values()
+    print "bytes per full field object:           {:>10.0f}".format(
+            sum(sys.getsizeof(f) + sys.getsizeof(f.__dict__) \
+                for f in full) / float(len(full)))
+    compact = Measurement.objects.get(rowid=1).fields.values()
+    print "bytes per compact field object:        {:>10.0f}".format(
+            sum(sys.getsizeof(f) for f in compact) / float(len(compact)))
+
+    db.close()
@@ -2,30 +2,614 @@
 #-*- coding: utf-8 -*-
 
 import sqlite3 as sqlite
-from threading import Lock
+import time
+from threading import Lock, RLock, local, current_thread
+from weakref import ref
+from contextlib import contextmanager
+from collections import OrderedDict
+from itertools import islice
+from operator import itemgetter
+import operator
+
+from field_expression import FieldExpression, sql_and, sql_not
+from executor import Executor, AsyncIterator
 
 __metaclass__ = type
 
 class DatabaseError(Exception):
     pass
 
+class SQLiteDatabaseError(DatabaseError):
+    pass
+
+class IntegrityError(DatabaseError):
+    """A UNIQUE or NOT NULL constraint failed (raised by all databases)"""
+    pass
+
+class IdentityMap(object):
+    """
+    Keeps up to 'size' record objects keyed by (table, rowid), so each row
+    is represented by exactly one object. If full, the least recently used 
+    object is evicted.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.objs = OrderedDict()
+        
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, table, rowid):
+        """Return the object for 'rowid' in 'table' or None, if not kept"""
+        key = (table, rowid)
+        obj = self.objs.pop(key, None)
+        if obj is None:
+            self.misses += 1
+            return None
+
+        # re-insert as most recently used
+        self.objs[key] = obj
+        self.hits += 1
+        return obj
+
+    def add(self, obj):
+        """Keep (saved) record object 'obj'"""
+        key = (obj.table, obj.rowid)
+        self.objs.pop(key, None)
+        self.objs[key] = obj
+
+        while len(self.objs) > self.size:
+            self.objs.popitem(last=False)
+            self.evictions += 1
+
+    def remove(self, obj):
+        """Forget about 'obj', e.g., after it was deleted"""
+        self.objs.pop((obj.table, obj.rowid), None)
+
+    def clear(self):
+        """Forget about all kept objects"""
+        self.objs.clear()
+
+    def stats(self):
+        """Return usage statistics as dict"""
+        return {"size": self.size, "used": len(self.objs), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+class LazyFields(dict):
+    """
+    The fields of a lazily loaded record object 'obj': each field (group) is
+    constructed from the kept database 'row' once it is accessed, see 
+    SQLiteDatabase.row_loader(). Iterating over all fields constructs the 
+    missing ones first, afterwards the row is released.
+    """
+
+    def __init__(self, obj, row, specs):
+        dict.__init__(self)
+        self.obj = obj
+        self.row = row
+        
+        # {name: (field, compact class, load column?, is group?)}
+        self.specs = specs
+
+        # the DeferredColumns (not inside 'row') and their row, once loaded
+        self.batch = None
+        self.deferred = None
+
+    def __missing__(self, name):
+        field, compact, column, group = self.specs[name]
+        out = self[name] = field.spawn(compact, self.obj)
+        if column:
+            if self.batch is not None and name in self.batch.names:
+                if self.deferred is None:
+                    self.batch.load()
+                out.load(self.deferred[name])
+            else:
+                out.load(self.row[name])
+        if group:
+            out.update_cls()
+        return out
+
+    def loaded(self):
+        """Return the (name, field) pairs constructed so far"""
+        return dict.items(self)
+
+    def materialize(self):
+        """Construct all missing fields"""
+        if self.row is not None:
+            for name in self.specs:
+                if not dict.__contains__(self, name):
+                    self.__missing__(name)
+            self.row = self.deferred = self.batch = None
+
+    def __reduce__(self):
+        """Pickled as plain dict of all fields, see materialize()"""
+        return (dict, (self.items(),))
+
+    def get(self, name, default=None):
+        return self[name] if name in self.specs else default
+
+    def __contains__(self, name):
+        return name in self.specs
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __iter__(self):
+        self.materialize()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self.materialize()
+        return dict.keys(self)
+
+    def values(self):
+        self.materialize()
+        return dict.values(self)
+
+    def items(self):
+        self.materialize()
+        return dict.items(self)
+
+    def itervalues(self):
+        self.materialize()
+        return dict.itervalues(self)
+
+    def iteritems(self):
+        self.materialize()
+        return dict.iteritems(self)
+
+class DeferredColumns(object):
+    """
+    The columns 'names' of 'cls' not selected for the lazy objects 'objs', 
+    once one of these columns is accessed, they are loaded for all objects
+    """
+
+    def __init__(self, db, cls, names):
+        self.db = db
+        self.cls = cls
+        self.names = frozenset(names)
+        self.objs = []
+
+    def add(self, obj):
+        """Add the (lazy) object 'obj' missing the columns"""
+        obj.fields.batch = self
+        self.objs.append(obj)
+
+    def load(self, chunk_size=500):
+        """Select the columns for all objects using (chunked) 'IN' queries"""
+        objs, self.objs = dict((obj.rowid, obj) for obj in self.objs), []
+        rowids = objs.keys()
+        cols = sorted(self.names)
+        for i in xrange(0, len(rowids), chunk_size):
+            chunk = rowids[i:i + chunk_size]
+            key = ("deferred", tuple(cols), len(chunk))
+            q = self.cls.stmt_cache.get(key)
+            if q is None:
+                q = self.cls.stmt_cache[key] = "SELECT rowid, {} FROM {} " \
+                        "WHERE rowid IN ({})".format(", ".join(cols), 
+                                self.cls.table, ",".join("?" * len(chunk)))
+            for row in self.db.query(q, chunk):
+                objs.pop(row["rowid"]).fields.deferred = row
+
+        if objs:
+            raise SQLiteDatabaseError("Could not load the deferred " + \
+                    "columns, rows were deleted: {}".format(objs.values()))
+
+class UnitOfWork(object):
+    """
+    New and changed record objects kept to be saved at once, see 
+    BaseDatabase::unit_of_work(). These are flushed, once 'max_size' 
+    objects are kept or the first one is kept for 'max_age' seconds (both
+    checked, when an object is added) and on commit().
+    """
+
+    def __init__(self, db, max_size=500, max_age=None, batch_size=500):
+        self.db = db
+        self.max_size = max_size
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.objs = OrderedDict()
+        self.started = None
+
+    def __len__(self):
+        return len(self.objs)
+
+    def add(self, obj):
+        """Keep 'obj' (and its not yet saved related objects) to be saved"""
+        self.keep(obj)
+        if len(self.objs) >= self.max_size or (self.max_age is not None \
+                and self.started is not None \
+                and time.time() - self.started >= self.max_age):
+            self.flush()
+
+    def keep(self, obj):
+        """(internal) keep 'obj' and the ones it depends on, if needed"""
+        if id(obj) in self.objs or (obj.rowid is not None and not obj.dirty):
+            return
+        if self.started is None:
+            self.started = time.time()
+        self.objs[id(obj)] = obj
+        for dep in self.dependencies(obj):
+            self.keep(dep)
+
+    def dependencies(self, obj):
+        """(internal) return the not yet saved objects 'obj' references"""
+        from fields import AbstractRelationField
+        return [field.pending() for field in obj.fields.itervalues() \
+                if isinstance(field, AbstractRelationField) and \
+                    field.pending() is not None]
+
+    def flush(self):
+        """
+        Save all kept objects inside one transaction, objects referenced by 
+        others are inserted first to get their rowids. The inserts and 
+        updates are grouped by table and set of columns, see 
+        Database::bulk_insert_objs() and bulk_update_objs(). 
+        """
+        pending, inserted, updated = self.objs.values(), [], []
+        self.objs, self.started = OrderedDict(), None
+        try:
+            with self.db.atomic():
+                while pending:
+                    ready = [obj for obj in pending \
+                            if not self.dependencies(obj)]
+                    if not ready:
+                        raise DatabaseError("Cannot save objects " \
+                                "referencing each other: {}".format(pending))
+                    
+                    new = [obj for obj in ready if obj.rowid is None]
+                    changed = [obj for obj in ready if obj.rowid is not None]
+                    inserted += new
+                    updated += changed
+                    self.db.bulk_insert_objs(new, self.batch_size)
+                    self.db.bulk_update_objs(changed, self.batch_size)
+
+                    done = set(id(obj) for obj in ready)
+                    pending = [obj for obj in pending if not id(obj) in done]
+        except:
+            # everything was rolled back, the objects are new (or changed) 
+            # again, the changed fields are not known anymore
+            imap = self.db.identity_map()
+            for obj in inserted:
+                if imap is not None and obj.rowid is not None:
+                    imap.remove(obj)
+                obj.rowid = None
+            for obj in inserted + updated:
+                self.db.mark_dirty(obj)
+            raise
+
+    # the kept objects are saved, when leaving unit_of_work()
+    commit = flush
+
+    def discard(self):
+        """Forget all kept (not yet saved) objects"""
+        self.objs, self.started = OrderedDict(), None
+
 class BaseDatabase(object):
     """Base datastorage interface"""
  
     # save the number of done queries
     query_counter = 0
 
+    # the identity map of the currently active session (for each thread)
+    sessions = local()
+
     # set to 'True' to get all plaintext sql-queries in 'stdout'
     debug = False
     
     # mmmh, system wide list of contributing records?! 
     contributed_records = []
 
+    # the Executor running the jobs passed to submit(), see executor()
+    job_executor = None
+    executor_workers = 2
+    executor_max_pending = 64
+    executor_lock = Lock()
+
     def contribute(self, cls):
         """Every Record has to "register" here"""
        
         self.contributed_records += [cls]
 
+    def identity_map(self):
+        """Return the identity map of the current thread's session or None"""
+        return getattr(BaseDatabase.sessions, "imap", None)
+
+    @contextmanager
+    def session(self, size=1000):
+        """
+        Inside a session each row is loaded into exactly one object, which
+        is kept in an identity map of (at most) 'size' objects for this 
+        thread. Looking up a kept object by its rowid (e.g., accessing a 
+        relation) does not query the database:
+
+        with db.session() as imap:
+            for book in Book.objects.all():
+                print book.author
+            print imap.stats()
+
+        Nested sessions share the outermost session's identity map.
+        """
+        imap = self.identity_map()
+        if imap is not None:
+            yield imap
+            return
+
+        imap = BaseDatabase.sessions.imap = IdentityMap(size)
+        try:
+            yield imap
+        finally:
+            BaseDatabase.sessions.imap = None
+
+    def executor(self):
+        """
+        Return the Executor (shared by all instances of this class) running 
+        the jobs passed to submit(), start it, if needed. Its few worker 
+        threads keep their own connections. 
+        """
+        cls = self.__class__
+        with BaseDatabase.executor_lock:
+            if cls.job_executor is None:
+                cls.job_executor = Executor(self.executor_workers, 
+                        self.executor_max_pending, name=cls.__name__)
+        return cls.job_executor
+
+    def submit(self, fn, *args, **kw):
+        """
+        Run 'fn(*args, **kw)' (e.g., a query) inside a worker of executor() 
+        without blocking the calling thread, returns the Future of the 
+        result. Sessions and units of work are kept for each thread, so 
+        these are not shared with the job:
+
+        future = db.submit(Book.objects.count)
+        print future.result()
+        """
+        return self.executor().submit(self.run_job, fn, args, kw)
+
+    def run_job(self, fn, args, kw):
+        """(internal) run 'fn' inside a worker, allow to interrupt it"""
+        future = self.executor().current()
+        if future is not None:
+            future.interrupt = self.interrupter()
+        return fn(*args, **kw)
+
+    def interrupter(self):
+        """
+        (internal) return the function aborting the running query of the 
+        current thread (to cancel a job) or None
+        """
+        return None
+
+    def shutdown_executor(self):
+        """Stop the executor() after all submitted jobs are done"""
+        cls = self.__class__
+        with BaseDatabase.executor_lock:
+            executor, cls.job_executor = cls.job_executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def current_unit_of_work(self):
+        """Return the unit of work of the current thread or None"""
+        return getattr(BaseDatabase.sessions, "uow", None)
+
+    @contextmanager
+    def unit_of_work(self, max_size=500, max_age=None, batch_size=500):
+        """
+        Inside a unit of work, the objects passed to DataManager::store() 
+        are kept and saved at once (write-behind), when leaving the block 
+        or once 'max_size' objects are kept or the oldest one is kept for 
+        'max_age' seconds. Related objects are saved first, so these are 
+        referenced by their rowids:
+
+        with db.unit_of_work() as uow:
+            for title, name in rows:
+                Book.objects.store(Book(title=title, author=Author(name=name)))
+        
+        Objects still kept on an exception are discarded, already flushed 
+        ones stay saved. Nested blocks share the outermost unit of work.
+        """
+        uow = self.current_unit_of_work()
+        if uow is not None:
+            yield uow
+            return
+
+        uow = BaseDatabase.sessions.uow = UnitOfWork(self, max_size, max_age,
+                batch_size)
+        try:
+            yield uow
+            uow.commit()
+        finally:
+            BaseDatabase.sessions.uow = None
+
+    def setup_relations(self):
+        """Setup inter-field relations"""
+        from fields import AbstractRelationField
+
+        # first go over all to gather relation-fields
+        relation_fields = []
+        for rec in self.contributed_records:
+            for k, v in rec.base_fields.items():
+                if issubclass(v.__class__, AbstractRelationField):
+                    v.setup_relation(rec)
+
+    def column_order(self, cls):
+        """(internal) return the (cached) sorted field names of 'cls'"""
+        out = cls.stmt_cache.get("column_order")
+        if out is None:
+            out = cls.stmt_cache["column_order"] = sorted(cls.base_fields)
+        return out
+
+    def field_names(self, cls):
+        """(internal) return the (cached) set of valid keys for 'cls'"""
+        out = cls.stmt_cache.get("field_names")
+        if out is None:
+            out = cls.stmt_cache["field_names"] = \
+                    frozenset(cls.base_fields.keys() + ["rowid"])
+        return out
+
+    def column_names(self, cls):
+        """(internal) return the (cached) sorted names of all table columns"""
+        out = cls.stmt_cache.get("column_names")
+        if out is None:
+            out = cls.stmt_cache["column_names"] = [k for k, v in \
+                    sorted(cls.base_fields.items()) \
+                    if v.name and v.get_create() not in ["", (), None]]
+        return out
+
+    def row_loader(self, cls, lazy=False):
+        """
+        (internal) return the (cached) function constructing a clean 
+        instance of 'cls' from a database row. Unlike cls(**row) the column
+        values are assigned directly, skipping the keyword handling and the 
+        validation done by Field::set(). A 'lazy' instance keeps the row 
+        and constructs each field once it is accessed, see LazyFields. Its
+        loader takes the DeferredColumns (missing in the row) as argument.
+        """
+        key = "lazy_row_loader" if lazy else "row_loader"
+        loader = cls.stmt_cache.get(key)
+        if loader is not None:
+            return loader
+        
+        from fields import BaseFieldGroup
+        
+        fields = cls.compact_fields()
+        columns = [(name, field.primary_key) for name, field, compact \
+                in fields if name in self.column_names(cls)]
+        groups = [name for name, field, compact in fields \
+                if isinstance(field, BaseFieldGroup)]
+        new, set_attr = object.__new__, object.__setattr__
+        
+        def loader(row):
+            obj = new(cls)
+            obj_fields = {}
+            set_attr(obj, "fields", obj_fields)
+            set_attr(obj, "rowid", row["rowid"])
+            set_attr(obj, "found_primary_key", False)
+            set_attr(obj, "dirty", False)
+
+            for name, field, compact in fields:
+                obj_fields[name] = field.spawn(compact, obj)
+            
+            # like BaseRecord.__init__(), the primary_key is not assigned 
+            for name, primary_key in columns:
+                if primary_key:
+                    set_attr(obj, "found_primary_key", (name, row[name]))
+                else:
+                    obj_fields[name].load(row[name])
+            
+            for name in groups:
+                obj_fields[name].update_cls()
+            return obj
+
+        # (field, compact class, load column?, is group?) for each field
+        specs = dict((name, (field, compact, 
+            (name, False) in columns, name in groups)) \
+                    for name, field, compact in fields)
+        keys = [name for name, primary_key in columns if primary_key]
+
+        def lazy_loader(row, batch=None):
+            obj = new(cls)
+            set_attr(obj, "fields", LazyFields(obj, row, specs))
+            set_attr(obj, "rowid", row["rowid"])
+            set_attr(obj, "found_primary_key", False)
+            set_attr(obj, "dirty", False)
+
+            for name in keys:
+                set_attr(obj, "found_primary_key", (name, row[name]))
+            if batch is not None:
+                batch.add(obj)
+            return obj
+        
+        loader = cls.stmt_cache[key] = lazy_loader if lazy else loader
+        return loader
+
+    def prepare_obj(self, obj, act):
+        """
+        (internal) call Field::pre_save() for all fields of 'obj' and return 
+        the list of column/value pairs to be saved, ordered by column name
+        """
+
+        # prepare all fields to be saved using Field::pre_save()
+        fields = dict(self.saved_fields(obj, act))
+        for attr, field in fields.iteritems():
+            if not field.pre_save(action=act, obj=obj):
+                raise DatabaseError("Field::pre_save() for field " + \
+                        "'{}' with value '{}' failed". \
+                        format(attr, getattr(obj, attr)))
+     
+        # collect data (omit empty-fields, pseudo-fields, unchanged fields
+        # on update) and replace BaseRecord descendants with their .rowid 
+        from baserecord import BaseRecord
+        attr_vals = []
+        for k in self.column_order(obj.__class__):
+            field = fields.get(k)
+            if field is None or (act == "update" and not field.dirty):
+                continue
+            val = field.get_save()
+            if val in ((), None):
+                continue
+            if isinstance(val, BaseRecord):
+                val = val.rowid
+            attr_vals.append({"col": k, "val": val})
+
+        return attr_vals
+
+    def finish_obj(self, obj, act):
+        """
+        (internal) postprocess fields of 'obj' using Field::post_save(), 
+        afterwards 'obj' is in sync with the database (clean)
+        """
+        for attr, field in self.saved_fields(obj, act):
+            if not field.post_save(action=act, obj=obj):
+                raise DatabaseError("Field::post_save() for field " + \
+                        "'{}' with value '{}' failed". \
+                        format(attr, getattr(obj, attr)))
+        self.mark_clean(obj)
+
+    def saved_fields(self, obj, act="update"):
+        """
+        (internal) return the (name, field) pairs of 'obj' to be handled on
+        saving, on update a lazy object's fields never loaded are skipped,
+        these cannot have changed (see LazyFields)
+        """
+        if act == "update" and isinstance(obj.fields, LazyFields):
+            return obj.fields.loaded()
+        return obj.fields.items()
+
+    def mark_dirty(self, obj):
+        """(internal) flag 'obj' and all its (loaded) fields as changed"""
+        for attr, field in self.saved_fields(obj):
+            field.dirty = True
+        obj.dirty = True
+
+    def mark_clean(self, obj):
+        """(internal) flag 'obj' and all its (loaded) fields as unchanged"""
+        for attr, field in self.saved_fields(obj):
+            field.dirty = False
+        obj.dirty = False
+
+    def load_obj(self, cls, row, lazy=False, batch=None):
+        """
+        (internal) construct a (clean, maybe 'lazy') instance of 'cls' from 
+        'row', inside a session an already loaded object for this row is 
+        returned instead. A lazy object is added to the DeferredColumns 
+        'batch', if 'row' misses these columns.
+        """
+        imap = self.identity_map()
+        if imap is not None:
+            obj = imap.get(cls.table, row["rowid"])
+            if obj is not None:
+                return obj
+
+        obj = self.row_loader(cls, True)(row, batch) if lazy \
+                else self.row_loader(cls)(row)
+        if imap is not None:
+            imap.add(obj)
+        return obj
+           
     def init(self, force=False):
         raise NotImplementedError()
     def close(self, force=False):
@@ -35,281 +619,2204 @@ class BaseDatabase(object):
     
     def save_obj(self, obj):
         raise NotImplementedError()
+    def bulk_insert_objs(self, objs, batch_size=None):
+        raise NotImplementedError()
+    def bulk_update_objs(self, objs, batch_size=None):
+        raise NotImplementedError()
     def delete_obj(self, obj):
         raise NotImplementedError()
     def filter(self):
         raise NotImplementedError()
-
-    def setup_relations(self):
+    def filter_iter(self):
         raise NotImplementedError()
+    def count(self):
+        raise NotImplementedError()
+    def exists(self):
+        raise NotImplementedError()
+    def aggregate(self, cls, aggs, group_by=(), order_by=None, limit=None, 
+            where=None):
+        raise NotImplementedError()
+    def compile_conditions(self, cls, exprs, kw, negate=False):
+        raise NotImplementedError()
+
     def create_tables(self):
         raise NotImplementedError()
 
-class MemoryDatabase(BaseDatabase):
+    def atomic(self):
+        raise NotImplementedError()
+
+class MemoryDatabaseError(DatabaseError):
     pass
 
-class SQLiteDatabase(BaseDatabase):
-    """Low-level object-based SQLiteDatabase interface"""
+class MemoryTable(object):
+    """
+    (internal) table of the MemoryDatabase, each row is kept as a tuple 
+    (rowid, column values...) by its rowid. An indexed column maps each 
+    (not None) value to the set of rowids having it. Each 'unique' key (a 
+    tuple of columns) maps its values to the rowid having them, like in sql
+    a key containing None never conflicts. The 'required' columns must not
+    be None.
+    """
 
-    # locking mechanism!
-    lock = Lock()
+    # the changes made inside the active MemoryDatabase::atomic() block, as
+    # (table, rowid, previous row or None, previous last_rowid), see undo()
+    journal = None
 
-    # central db-connection keeping:
-    db_file = None 
-    db_con = None 
+    def __init__(self, name, columns, defaults, indexed=(), unique=(),
+            required=()):
+        self.name = name
+        self.columns = ("rowid",) + tuple(columns)
+        self.pos = dict((col, i) for i, col in enumerate(self.columns))
+        self.defaults = (None,) + tuple(defaults)
+        self.unique = dict((tuple(cols), {}) for cols in unique)
+        self.required = tuple(required)
+        self.indexes = dict((col, {}) for col in indexed)
+        self.rows = {}
+        self.last_rowid = 0
 
-    # logger instance
-    log = None
-    
-    def __init__(self, db_fn=None, force=False, full=True, logger=None):
-        if logger is not None:
-            SQLiteDatabase.log = logger
+    def key(self, cols, row):
+        """(internal) return the values of the columns 'cols' of 'row'"""
+        return tuple(row[self.pos[col]] for col in cols)
 
-        if db_fn is not None:
-            self.setup(db_fn, force, full)
+    def check(self, row):
+        """(internal) raise, if 'row' violates a constraint of this table"""
+        for col in self.required:
+            if row[self.pos[col]] is None:
+                raise IntegrityError("NOT NULL constraint failed: " \
+                        "{}.{}".format(self.name, col))
 
+        for cols, keys in self.unique.iteritems():
+            key = self.key(cols, row)
+            if not None in key and keys.get(key, row[0]) != row[0]:
+                raise IntegrityError("UNIQUE constraint failed: {}". \
+                        format(", ".join("{}.{}".format(self.name, col) \
+                            for col in cols)))
 
-    def setup(self, db_fn, force=False, full=True):
-        """Set up SQLiteDatabase connection"""
-        if SQLiteDatabase.db_con is None or force is True:
-            SQLiteDatabase.db_file = db_fn
-    
-        if full:
-            self.setup_relations()
-            self.create_tables()
+    def index(self, row):
+        """(internal) add 'row' to the indexes and unique keys"""
+        for col, index in self.indexes.iteritems():
+            val = row[self.pos[col]]
+            if val is not None:
+                index.setdefault(val, set()).add(row[0])
+        for cols, keys in self.unique.iteritems():
+            key = self.key(cols, row)
+            if not None in key:
+                keys[key] = row[0]
+
+    def unindex(self, row):
+        """(internal) remove 'row' from the indexes and unique keys"""
+        for col, index in self.indexes.iteritems():
+            val = row[self.pos[col]]
+            if val is not None:
+                index[val].discard(row[0])
+                if not index[val]:
+                    del index[val]
+        for cols, keys in self.unique.iteritems():
+            key = self.key(cols, row)
+            if keys.get(key) == row[0]:
+                del keys[key]
+
+    def insert(self, vals):
+        """Insert the row with the column values 'vals', return its rowid"""
+        row = list(self.defaults)
+        for col, val in vals.iteritems():
+            row[self.pos[col]] = val
+        row[0] = self.last_rowid + 1
+        row = tuple(row)
+        self.check(row)
+        self.log(row[0])
+        self.rows[row[0]] = row
+        self.index(row)
+        self.last_rowid = row[0]
+        return row[0]
+
+    def update(self, rowid, vals):
+        """Replace the column values 'vals' of the row 'rowid'"""
+        old = self.rows[rowid]
+        row = list(old)
+        for col, val in vals.iteritems():
+            row[self.pos[col]] = val
+        row = tuple(row)
+        self.check(row)
+        self.log(rowid)
+        self.unindex(old)
+        self.rows[rowid] = row
+        self.index(row)
+
+    def delete(self, rowid):
+        """Remove the row 'rowid' (if existing)"""
+        if rowid in self.rows:
+            self.log(rowid)
+        row = self.rows.pop(rowid, None)
+        if row is not None:
+            self.unindex(row)
+
+    def lookup(self, col, val):
+        """Return the set of rowids having 'val' in the indexed column 'col'"""
+        if col == "rowid":
+            return set((val,)) if val in self.rows else set()
+        return self.indexes[col].get(val, set())
+
+    def log(self, rowid):
+        """(internal) journal the row 'rowid' before it is changed"""
+        if MemoryTable.journal is not None:
+            MemoryTable.journal.append((self, rowid, self.rows.get(rowid), 
+                self.last_rowid))
+
+    def undo(self, rowid, row, last_rowid):
+        """(internal) reset the row 'rowid' to the journaled 'row'"""
+        old = self.rows.pop(rowid, None)
+        if old is not None:
+            self.unindex(old)
+        if row is not None:
+            self.rows[rowid] = row
+            self.index(row)
+        self.last_rowid = last_rowid
+
+class MemoryDatabase(BaseDatabase):
+    """
+    In-process datastorage without any sql, the rows of each table are kept
+    as tuples inside a MemoryTable. Unique, primary_key and relation columns
+    (and the ones to be indexed) get a hash index, the rows matching an 
+    equality condition on such a column are found without a scan. Like in
+    sqlite, UNIQUE (also declared unique indexes) and NOT NULL ('required')
+    constraints raise an IntegrityError. A record class is stored here, if
+    this is its 'database':
+
+    class Book(BaseRecord):
+        database = MemoryDatabase()
+        title = StringField(size=100)
+
+    Like the SQLiteDatabase, all instances share the same tables.
+    """
+
+    # the records stored here, see contribute()
+    contributed_records = []
+
+    # MemoryTable for each table name, see create_tables()
+    tables = {}
+
+    # held while accessing the tables and for a whole atomic() block
+    lock = RLock()
+
+    # python functions for the operators used by compile_condition()
+    operators = {
+        "=": operator.eq, "==": operator.eq, "<>": operator.ne, 
+        "!=": operator.ne, "<": operator.lt, "<=": operator.le, 
+        ">": operator.gt, ">=": operator.ge,
+    }
+
+    def init(self, force=False):
+        pass
 
     def close(self, force=False):
-        """Close current database connection"""
-        if SQLiteDatabase.db_con is not None or force is True:
-            if SQLiteDatabase.db_con is not None:
-                SQLiteDatabase.db_con.commit()
-                SQLiteDatabase.db_con.close()
-            SQLiteDatabase.db_file = None
-            SQLiteDatabase.db_con = None
- 
-    def backup(self, fn):
-        """Backup current database to 'fn'"""        
-        dump = []
-        if SQLiteDatabase.db_con:
-            new_con = sqlite.connect(fn)
-            new_con.isolation_level = None
-            for line in SQLiteDatabase.db_con.iterdump():
-                dump.append(line)
-                if len(dump) >= 1000:
-                    new_con.executescript("".join(dump))
-                    dump = []
+        pass
 
-            if len(dump) > 0:
-                new_con.executescript("".join(dump))
-            new_con.close()
-        else:
-            raise DatabaseError("No database opened")
-            
     def reset(self):
-        """Close current database and reset all relevant counters"""
-        if SQLiteDatabase.db_con is not None:
-            self.close()
-        SQLiteDatabase.query_counter = 0
-        SQLiteDatabase.contributed_records = []
+        """Drop all tables and reset all relevant counters"""
+        self.shutdown_executor()
+        
+        # cleared in place, contribute() may have bound them to an instance
+        MemoryDatabase.tables.clear()
+        del MemoryDatabase.contributed_records[:]
+        MemoryDatabase.query_counter = 0
+
+    def create_tables(self):
+        """Create the (missing) table for each contributed record"""
+        from fields import ManyToOneRelation, OneToOneRelation
+
+        for rec in self.contributed_records:
+            if rec.table in self.tables:
+                continue
+
+            if len(rec.base_fields) == 0:
+                raise MemoryDatabaseError("Could not create table: {}, " \
+                        "no fields!".format(rec.table))
+            
+            columns = self.column_names(rec)
+            fields = [rec.base_fields[name] for name in columns]
+            unique = [(f.name,) for f in fields if f.unique or f.primary_key]
+            required = [f.name for f in fields if f.required]
+            
+            # the leading column of each declared index is hashed (for all
+            # rows, also of a partial index), a unique one is enforced
+            declared = set()
+            for index in getattr(rec, "indexes", ()):
+                cols = tuple(x.lstrip("+-") for x in index.names)
+                if any(not x in columns + ["rowid"] for x in cols):
+                    raise MemoryDatabaseError("{!r} contains non column " \
+                            "keys, availible are only: {}".format(index, 
+                                ", ".join(columns)))
+                if index.unique and index.where:
+                    raise MemoryDatabaseError("{!r} of {}: a partial " \
+                            "unique index is not supported by the " \
+                            "MemoryDatabase".format(index, rec.__name__))
+                if index.unique:
+                    unique.append(cols)
+                declared.add(cols[0])
+
+            indexed = [f.name for f in fields if (f.name,) in unique or \
+                    f.name in declared or f.index or \
+                    isinstance(f, (ManyToOneRelation, OneToOneRelation))]
+            
+            with self.lock:
+                self.tables[rec.table] = MemoryTable(rec.table, columns, 
+                        [f.default for f in fields], indexed, unique, 
+                        required)
+
+    def table(self, cls):
+        """(internal) return the MemoryTable of 'cls'"""
+        table = self.tables.get(cls.table)
+        if table is None:
+            raise MemoryDatabaseError("No table: {}, call create_tables()". \
+                    format(cls.table))
+        return table
+
+    @contextmanager
+    def atomic(self):
+        """
+        All changes inside the with-block are kept as one unit, on any 
+        exception the tables are restored as they were, when entering the
+        block. The tables are locked for the whole block, each changed row
+        is journaled (see MemoryTable.journal) and on an exception the 
+        changes are undone in reverse order. Blocks may be nested.
+        """
+        with self.lock:
+            outer = MemoryTable.journal is None
+            if outer:
+                MemoryTable.journal = []
+            mark = len(MemoryTable.journal)
+            try:
+                yield self
+            except:
+                journal = MemoryTable.journal
+                while len(journal) > mark:
+                    entry = journal.pop()
+                    entry[0].undo(*entry[1:])
+                raise
+            finally:
+                if outer:
+                    MemoryTable.journal = None
+
+    # 'transaction' reads better for the outermost block
+    transaction = atomic
+
+    def save_obj(self, obj):
+        """Insert the object, if it has no rowid yet, update it otherwise"""
+        act = "update" if obj.rowid else "insert"
+        
+        # a clean object is already in sync with the database
+        if act == "update" and not obj.dirty:
+            return True
+
+        attr_vals = self.prepare_obj(obj, act)
+        if act == "update" and not attr_vals:
+            self.finish_obj(obj, act)
+            return True
+        
+        table = self.table(obj.__class__)
+        vals = dict((x["col"], x["val"]) for x in attr_vals)
+        with self.lock:
+            if act == "insert":
+                obj.rowid = table.insert(vals)
+            else:
+                table.update(obj.rowid, vals)
+
+        if act == "insert" and self.identity_map() is not None:
+            self.identity_map().add(obj)
+        
+        self.finish_obj(obj, act)
+        return True
+
+    def bulk_insert_objs(self, objs, batch_size=500):
+        """Insert all (not yet saved) objects in 'objs' as one unit"""
+        objs = list(objs)
+        if any(obj.rowid for obj in objs):
+            raise MemoryDatabaseError("Cannot bulk insert an already " \
+                    "saved object: {}".format([obj for obj in objs \
+                        if obj.rowid][0]))
+        try:
+            with self.atomic():
+                for obj in objs:
+                    self.save_obj(obj)
+        except:
+            # the rows were rolled back, the objects are new again
+            imap = self.identity_map()
+            for obj in objs:
+                if obj.rowid is not None:
+                    if imap is not None:
+                        imap.remove(obj)
+                    obj.rowid = None
+                    self.mark_dirty(obj)
+            raise
+        return True
+
+    def bulk_update_objs(self, objs, batch_size=500):
+        """Save the changed columns of all objects in 'objs' as one unit"""
+        objs = list(objs)
+        if any(not obj.rowid for obj in objs):
+            raise MemoryDatabaseError("Cannot bulk update a not yet saved " \
+                    "object: {}".format([obj for obj in objs \
+                        if not obj.rowid][0]))
+        done = []
+        try:
+            with self.atomic():
+                for obj in objs:
+                    done.append(obj)
+                    self.save_obj(obj)
+        except:
+            # the changes were rolled back, the objects are changed again
+            for obj in done:
+                self.mark_dirty(obj)
+            raise
+        return True
+
+    def insert_rows(self, cls, columns, rows, batch_size=500):
+        """
+        Insert the tuples in 'rows' (values for 'columns') into the table of 
+        'cls' as one unit, returns the number of inserted rows
+        """
+        columns = tuple(columns)
+        valid = self.column_names(cls)
+        if not columns or len(set(columns)) != len(columns) or \
+                any(not x in valid for x in columns):
+            raise MemoryDatabaseError("Cannot insert the columns: {}, " \
+                    "availible are only: {}".format(", ".join(columns), 
+                        ", ".join(valid)))
+
+        table, count = self.table(cls), 0
+        with self.atomic():
+            for row in rows:
+                if len(row) != len(columns):
+                    raise MemoryDatabaseError("Each row needs exactly one " \
+                            "value for each column: {}". \
+                            format(", ".join(columns)))
+                table.insert(dict(zip(columns, row)))
+                count += 1
+        return count
+
+    def delete_obj(self, obj):
+        """Delete given object from the MemoryDatabase"""
+        if self.identity_map() is not None:
+            self.identity_map().remove(obj)
+
+        table = self.table(obj.__class__)
+        with self.lock:
+            table.delete(obj.rowid)
+        return True
+
+    def filter(self, cls, operator="=", limit=None, order_by=None, 
+            after=None, related=None, where=None, lazy=False, deferred=None,
+            **kw):
+        """
+        Return instances of 'cls' according to given values in 'kw' and 
+        the conditions in 'where', see SQLiteDatabase::filter(). As all 
+        rows are in memory already, 'related', 'lazy' and 'deferred' have
+        no effect: related objects are looked up by their (hashed) rowid.
+        """
+        table = self.table(cls)
+        return [self.load_obj(cls, dict(zip(table.columns, row))) \
+                for row in self.select(cls, operator, limit, order_by, after,
+                    where, kw)]
+
+    def filter_iter(self, cls, operator="=", limit=None, order_by=None, 
+            after=None, related=None, where=None, chunk_size=500, 
+            lazy=False, deferred=None, **kw):
+        """
+        Same as filter(), but returns a generator constructing each 
+        instance not before it is needed
+        """
+        table = self.table(cls)
+        rows = self.select(cls, operator, limit, order_by, after, where, kw)
+        return (self.load_obj(cls, dict(zip(table.columns, row))) \
+                for row in rows)
+
+    def filter_values(self, cls, columns, limit=None, order_by=None, 
+            where=None, chunk_size=500):
+        """
+        Return a generator of the rows (only 'columns') selected like 
+        filter() would do, without constructing any instance of 'cls'
+        """
+        table = self.table(cls)
+        if any(not x in table.pos for x in columns):
+            raise MemoryDatabaseError("'values' contains non column " \
+                    "keys: {}, availible are only: {}".format(
+                        ", ".join(columns), ", ".join(table.columns)))
+
+        pos = [table.pos[x] for x in columns]
+        rows = self.select(cls, "=", limit, order_by, None, where, {})
+        return (tuple(row[i] for i in pos) for row in rows)
+
+    def count(self, cls, operator="=", limit=None, where=None, **kw):
+        """Return the number of rows filter() would return"""
+        return len(self.select(cls, operator, limit, None, None, where, kw))
+
+    def exists(self, cls, operator="=", limit=None, where=None, **kw):
+        """Return True, if filter() would return at least one row"""
+        return self.count(cls, operator, limit, where, **kw) > 0
+
+    def aggregate(self, cls, aggs, group_by=(), order_by=None, limit=None, 
+            where=None):
+        """Aggregates are computed by sql, see SQLiteDatabase::aggregate()"""
+        raise MemoryDatabaseError("aggregate() (and annotate()) is not " \
+                "supported by the MemoryDatabase, used by: {}". \
+                format(cls.__name__))
+
+    def prefetch_related(self, objs, names, chunk_size=500):
+        """
+        Load the related objects of the 1:n relation fields 'names' for all
+        record objects in 'objs' (of the same class), each group is found 
+        using the index of the backref column
+        """
+        from fields import OneToManyRelation
+
+        if not objs:
+            return
+        
+        cls = objs[0].__class__
+        for name in names:
+            field = cls.base_fields.get(name)
+            if not isinstance(field, OneToManyRelation):
+                raise MemoryDatabaseError("prefetch_related() needs a 1:n " \
+                        "relation field of {}, got: {}". \
+                        format(cls.__name__, name))
+
+            for obj in objs:
+                obj.fields[name].rel_objs = self.filter(field.rel_record, 
+                        **{field.backref: obj.rowid})
+
+    def compile_condition(self, cls, kw, operator="=", negate=False):
+        """
+        (internal) return the condition comparing the fields in 'kw' to 
+        their values using 'operator' (AND-ed, optionally negated), i.e., 
+        the function evaluating a row and the list of (column, value) pairs
+        to be looked up inside the indexes
+        """
+        from baserecord import BaseRecord
+
+        table = self.table(cls)
+        if any(not k in table.pos for k in kw):
+            raise MemoryDatabaseError(".filter got a non-field keyword " \
+                    "(one of: {}), instead of one of: '{}'". \
+                    format(", ".join(kw.keys()), ", ".join(table.columns)))
+        if not operator in self.operators:
+            raise MemoryDatabaseError("Unknown operator: {}".format(operator))
+
+        funcs, lookups = [], []
+        for k, v in sorted(kw.items()):
+            if isinstance(v, BaseRecord):
+                v = v.rowid
+            funcs.append(self.compare(table.pos[k], v, operator))
+            if v is not None and operator in ("=", "==") and not negate:
+                lookups.append((k, v))
+        
+        func = self.all_of(funcs)
+        return (lambda row: sql_not(func(row))) if negate else func, lookups
+
+    def compare(self, pos, val, operator):
+        """(internal) function comparing the item 'pos' of a row to 'val'"""
+        
+        # "IS NULL" or "IS NOT NULL"
+        if val is None:
+            null = not operator in ("<>", "!=")
+            return lambda row: (row[pos] is None) == null
+
+        op = self.operators[operator]
+        return lambda row: None if row[pos] is None else op(row[pos], val)
+
+    def all_of(self, funcs):
+        """(internal) function AND-ing the results of 'funcs' for a row"""
+        if len(funcs) == 1:
+            return funcs[0]
+        return lambda row: reduce(sql_and, (f(row) for f in funcs), True)
+
+    def expr_lookups(self, expr):
+        """
+        (internal) return the (column, value) pairs FieldExpression 'expr' 
+        requires to be equal, i.e., the ones to be looked up in the indexes
+        """
+        from fields import AbstractField
+        from baserecord import BaseRecord
+
+        if expr.op is operator.and_:
+            return [x for arg in (expr.arg1, expr.arg2) \
+                    if isinstance(arg, FieldExpression) \
+                        for x in self.expr_lookups(arg)]
+
+        val = expr.arg2
+        if expr.op is not operator.eq or \
+                not isinstance(expr.arg1, AbstractField) or \
+                isinstance(val, (AbstractField, FieldExpression)) or \
+                val is None or (isinstance(val, basestring) and \
+                    val in expr.context):
+            return []
+        return [(expr.arg1.name, val.rowid \
+                if isinstance(val, BaseRecord) else val)]
+
+    def compile_conditions(self, cls, exprs, kw, negate=False):
+        """
+        (internal) return the tuple of conditions for the FieldExpressions
+        'exprs' and the 'kw' conditions (AND-ed, optionally negated), as 
+        kept inside QuerySet::where, see compile_condition()
+        """
+        table = self.table(cls)
+        conds = [self.compile_condition(cls, kw)] if kw else []
+        conds += [(expr.to_func(cls, table.pos), self.expr_lookups(expr)) \
+                for expr in exprs]
+        if not negate or not conds:
+            return tuple(conds)
+        
+        func = self.all_of([func for func, lookups in conds])
+        return ((lambda row: sql_not(func(row)), []),)
+
+    def select(self, cls, operator, limit, order_by, after, where, kw):
+        """(internal) return the list of rows (tuples) filter() would return"""
+        table = self.table(cls)
+        conds = list(where or ())
+        if kw:
+            conds.append(self.compile_condition(cls, kw, operator))
+        func = self.all_of([func for func, lookups in conds]) \
+                if conds else None
+
+        # candidates: the rows having all values found in the indexes (or 
+        # the rowid itself)
+        lookups = [(col, val) for f, l in conds for col, val in l \
+                if col in table.indexes or col == "rowid"]
+        
+        with self.lock:
+            if lookups:
+                rowids = set.intersection(*[table.lookup(col, val) \
+                        for col, val in lookups])
+            else:
+                rowids = table.rows.keys()
+            rows = [table.rows[rowid] for rowid in sorted(rowids)]
+
+        if func is not None:
+            rows = [row for row in rows if func(row)]
+
+        # --- ORDER BY, sort once for each key (stable), the last one first
+        keys = order_by or ()
+        if any(not x.strip("+-") in table.pos for x in keys):
+            raise MemoryDatabaseError("'order by' contains non field " \
+                    "keys: {}, availible are only: {}".format(
+                        ", ".join(keys), ", ".join(table.columns)))
+        keys = [(table.pos[x.strip("+-")], x.startswith("-")) for x in keys]
+        for pos, desc in reversed(keys):
+            rows.sort(key=itemgetter(pos), reverse=desc)
+
+        # --- keyset (seek) pagination: only rows following the key 'after'
+        if after is not None:
+            keys = keys or [(0, False)]
+            if len(after) != len(keys):
+                raise MemoryDatabaseError("'after' needs exactly one " \
+                        "value for each key: {}".format(
+                            ", ".join(order_by or ("rowid",))))
+            rows = [row for row in rows if self.follows(row, keys, after)]
+
+        # --- LIMIT (offset, count), count may be -1 (i.e., no limit)
+        if limit:
+            offset, count = limit
+            rows = rows[offset:offset + count if count >= 0 else None]
+        return rows
+
+    def follows(self, row, keys, after):
+        """(internal) True, if 'row' is ordered after the key 'after'"""
+        for (pos, desc), val in zip(keys, after):
+            if row[pos] != val:
+                return row[pos] < val if desc else row[pos] > val
+        return False
+
+class PooledConnection(object):
+    """A single sqlite connection and its per-connection state"""
+
+    def __init__(self, con, lock):
+        self.con = con
+
+        # locking mechanism! (re-entrant, held during a whole transaction)
+        self.lock = lock
+
+        # nesting depth of the currently active transaction (0 -> none)
+        self.tx_depth = 0
+
+        # rowid of the last row inserted using this connection
+        self.lastrowid = None
+
+        # (weak reference to) the thread owning this connection, see 
+        # ConnectionPool::get(), None for a shared connection
+        self.thread = None
+
+    def orphaned(self):
+        """True, if the thread owning this connection has finished"""
+        if self.thread is None:
+            return False
+        thread = self.thread()
+        return thread is None or not thread.is_alive()
+
+class ConnectionPool(object):
+    """
+    Keeps one connection per thread for the database file 'db_file', each
+    configured once while opening using the 'pragmas' ({name: value}, see
+    SQLiteDatabase.profiles). File databases should use the WAL journal, so
+    readers do not block each other nor the (single) writer. An in-memory
+    database exists only inside its connection, so all threads share one.
+    The connections of finished threads are closed, before opening a new one.
+    """
+
+    # 'page_size' must be set before switching to WAL
+    pragma_order = ("page_size", "journal_mode", "synchronous", "cache_size",
+            "mmap_size", "temp_store")
+
+    def __init__(self, db_file, timeout=5.0, pragmas=None):
+        self.db_file = db_file
+        self.timeout = timeout
+        self.memory = (db_file == ":memory:")
+        self.pragmas = pragmas or {"journal_mode": "WAL"}
+
+        self.local = local()
+        self.lock = Lock()
+        self.connections = []
+
+    def open(self):
+        """(internal) open and configure a new connection"""
+        con = sqlite.connect(self.db_file, timeout=self.timeout,
+                check_same_thread=False, cached_statements=256)
+        
+        # to return a dict for each row
+        con.row_factory = sqlite.Row
+        
+        # to auto-commit, transactions are explicitly handled by atomic()
+        # (re-setting this later on implicitly commits!)
+        con.isolation_level = None
+        
+        ### text-encoding 
+        #self.db_con.text_factory = sqlite.OptimizedUnicode
+        con.text_factory = unicode
+
+        # an in-memory database has no journal file
+        for name in self.pragma_order:
+            if name in self.pragmas and not (self.memory and 
+                    name == "journal_mode"):
+                con.execute("PRAGMA {}={}".format(name, self.pragmas[name]))
+
+        return PooledConnection(con, RLock())
+
+    def get(self):
+        """Return the connection for the current thread"""
+        pcon = getattr(self.local, "pcon", None)
+        if pcon is not None:
+            return pcon
+
+        with self.lock:
+            if self.memory and self.connections:
+                pcon = self.connections[0]
+            else:
+                self.prune()
+                pcon = self.open()
+                if not self.memory:
+                    pcon.thread = ref(current_thread())
+                self.connections.append(pcon)
+
+        self.local.pcon = pcon
+        return pcon
+
+    def prune(self):
+        """(internal) close the connections of all finished threads"""
+        alive = []
+        for pcon in self.connections:
+            if pcon.orphaned():
+                pcon.con.close()
+            else:
+                alive.append(pcon)
+        self.connections = alive
+
+    def close(self):
+        """Close all connections of this pool"""
+        with self.lock:
+            for pcon in self.connections:
+                pcon.con.commit()
+                pcon.con.close()
+            self.connections = []
+        self.local = local()
+
+class SQLiteDatabase(BaseDatabase):
+    """Low-level object-based SQLiteDatabase interface"""
+
+    # central db-connection keeping, one connection per thread:
+    db_file = None 
+    pool = None 
+    pool_lock = Lock()
+
+    # logger instance
+    log = None
+
+    # performance profiles, pragmas applied to each opened connection
+    profiles = {
+        # sqlite's defaults, but using WAL
+        "durable": {"journal_mode": "WAL", "synchronous": "FULL", 
+                    "cache_size": -2000, "mmap_size": 0, 
+                    "temp_store": "DEFAULT", "page_size": 4096},
+        # a commit may be lost on power failure, but never corrupts the db
+        "balanced": {"journal_mode": "WAL", "synchronous": "NORMAL", 
+                     "cache_size": -16000, "mmap_size": 256 * 1024 ** 2, 
+                     "temp_store": "MEMORY", "page_size": 4096},
+        # for (re-)creatable data only, no fsync() at all
+        "bulk-load": {"journal_mode": "MEMORY", "synchronous": "OFF",
+                      "cache_size": -64000, "mmap_size": 256 * 1024 ** 2, 
+                      "temp_store": "MEMORY", "page_size": 8192}
+    }
+
+    # pragmas of the active profile, see setup()
+    pragmas = profiles["durable"]
+    
+    def __init__(self, db_fn=None, force=False, full=True, logger=None, 
+            profile=None):
+        if logger is not None:
+            SQLiteDatabase.log = logger
+
+        if db_fn is not None:
+            self.setup(db_fn, force, full, profile)
+
+
+    def setup(self, db_fn, force=False, full=True, profile=None):
+        """
+        Set up SQLiteDatabase connection, 'profile' may name one of the 
+        'profiles' or be a dict of pragmas overriding "durable" (default). 
+        The 'page_size' only applies to a new database file.
+        """
+        if SQLiteDatabase.pool is None or force is True:
+            SQLiteDatabase.db_file = db_fn
+            SQLiteDatabase.pragmas = self.profile_pragmas(profile)
+    
+        if full:
+            self.setup_relations()
+            self.create_tables()
+
+    def profile_pragmas(self, profile=None):
+        """(internal) return the pragmas for 'profile', see setup()"""
+        if profile is None:
+            return self.profiles["durable"]
+        
+        if isinstance(profile, dict):
+            pragmas = dict(self.profiles["durable"])
+            pragmas.update(profile)
+        elif profile in self.profiles:
+            pragmas = self.profiles[profile]
+        else:
+            raise DatabaseError("Unknown profile: '{}', availible are: {}". \
+                    format(profile, ", ".join(sorted(self.profiles))))
+
+        wrong = [k for k in pragmas if not k in ConnectionPool.pragma_order]
+        if wrong:
+            raise DatabaseError("Unsupported pragma(s): {}". \
+                    format(", ".join(wrong)))
+        return pragmas
+
+    def settings(self):
+        """
+        Return the effective settings {pragma: value} of the current 
+        thread's connection, e.g., to verify the applied profile
+        """
+        con = self.connect().con
+        out = {}
+        for name in ConnectionPool.pragma_order:
+            # e.g., 'mmap_size' gives no value for in-memory databases
+            row = con.execute("PRAGMA {}".format(name)).fetchone()
+            out[name] = row[0] if row is not None else None
+        return out
+
+    def close(self, force=False):
+        """Close current database connection"""
+        self.shutdown_executor()
+        with SQLiteDatabase.pool_lock:
+            if SQLiteDatabase.pool is not None or force is True:
+                if SQLiteDatabase.pool is not None:
+                    SQLiteDatabase.pool.close()
+                SQLiteDatabase.db_file = None
+                SQLiteDatabase.pool = None
+ 
+    def backup(self, fn):
+        """Backup current database to 'fn'"""        
+        dump = []
+        if SQLiteDatabase.pool:
+            new_con = sqlite.connect(fn)
+            new_con.isolation_level = None
+            for line in self.connect().con.iterdump():
+                dump.append(line)
+                if len(dump) >= 1000:
+                    new_con.executescript("".join(dump))
+                    dump = []
+
+            if len(dump) > 0:
+                new_con.executescript("".join(dump))
+            new_con.close()
+        else:
+            raise DatabaseError("No database opened")
+            
+    def reset(self):
+        """Close current database and reset all relevant counters"""
+        if SQLiteDatabase.pool is not None:
+            self.close()
+        SQLiteDatabase.query_counter = 0
+        SQLiteDatabase.contributed_records = []
+
+    def create_tables(self):
+        """Check for all 'cls', if we need to create the needed table"""
+        
+        # finally create all tables inside the SQLiteDatabase
+        for rec in self.contributed_records:             
+            # there is no 'show tables' sql-statement in sqlite,
+            # so query sqlite_master
+            q = "SELECT * FROM sqlite_master WHERE type='table' AND " + \
+                    "tbl_name='{}'".format(rec.table)
+            res = self.query(q)
+            
+            # table was found - skip creation...
+            if len(res) == 1:
+                if self.debug:
+                    print "[i] table: {} exists---skipping...".format(rec.table)
+                continue
+
+            ## here we haven't found the table
+            # first check for field-number > 0
+            if len(rec.base_fields) == 0:
+                raise SQLiteDatabaseError("Could not create table: {}, " + \
+                        "no fields!".format(rec.table))
+
+            # actual creation of create-table-query 
+            q = "CREATE TABLE {} ({})". \
+                    format(rec.table, ", ".join(x.get_create() \
+                        for x in rec.base_fields.values() \
+                            if x.name and x.get_create() not in ["", (), None])
+                    )
+            self.query(q)
+
+        # (missing) indexes are also added to already existing tables
+        for rec in self.contributed_records:
+            for index in self.indexes(rec):
+                self.query(index.get_create(self, rec))
+
+    def indexes(self, cls):
+        """
+        Return all Index objects for 'cls': the ones declared in the class 
+        attribute 'indexes', one for each field with 'index=True' and one 
+        for each (n:1, 1:1) relation column, as these are used to resolve 
+        the backrefs. Columns with an implicit (unique) index or leading a 
+        declared (not partial) index are skipped.
+        """
+        from fields import ManyToOneRelation, OneToOneRelation
+
+        out = list(getattr(cls, "indexes", ()))
+        declared = set(index.names[0].lstrip("+-") for index in out \
+                if not index.where)
+        for name in self.column_names(cls):
+            field = cls.base_fields[name]
+            if field.unique or field.primary_key or name in declared:
+                continue
+            if field.index or isinstance(field, 
+                    (ManyToOneRelation, OneToOneRelation)):
+                out.append(Index(name))
+        return out
+       
+    def connect(self):
+        """
+        (internal) return the (configured) connection for the current thread,
+        open it if needed
+        """
+        pool = SQLiteDatabase.pool
+        if pool is None:
+            with SQLiteDatabase.pool_lock:
+                if SQLiteDatabase.pool is None:
+                    if SQLiteDatabase.db_file is None:
+                        raise DatabaseError("No database opened")
+                    SQLiteDatabase.pool = ConnectionPool(
+                            SQLiteDatabase.db_file, 
+                            pragmas=SQLiteDatabase.pragmas)
+                pool = SQLiteDatabase.pool
+        return pool.get()
+
+    def interrupter(self):
+        """
+        (internal) return the function aborting the running query of the
+        current thread's connection, all threads share the connection of an
+        in-memory database, so its queries are not interrupted
+        """
+        pcon = self.connect()
+        if SQLiteDatabase.pool.memory:
+            return None
+        return pcon.con.interrupt
+
+    @property
+    def lastrowid(self):
+        """rowid of the last row inserted by the current thread"""
+        return self.connect().lastrowid
+
+    def query(self, q, args=()):
+        """
+        Actually performing a query. Replace variables in 'q' with "?" and
+        pass the variables in the second argument 'args' as tupel
+        """
+        
+        if self.debug:
+            print "[SQL]: |- {} -| values: {}".format(q, args)
+
+        SQLiteDatabase.query_counter += 1
+               
+        pcon = self.connect()
+        with pcon.lock:
+            cursor = pcon.con.cursor()
+            try:
+                cursor.execute(q, args)
+            except sqlite.IntegrityError as e:
+                raise IntegrityError(str(e))
+            pcon.lastrowid = cursor.lastrowid
+
+            out = cursor.fetchall() if q.lower().startswith("select") \
+                    else True            
+
+        return out
+
+    def query_iter(self, q, args=(), chunk_size=500):
+        """
+        Generator performing the select query 'q' and yielding its rows, 
+        which are fetched in chunks of 'chunk_size' rows. The lock is only 
+        held while fetching a chunk, not during the whole iteration.
+        """
+        
+        if self.debug:
+            print "[SQL]: |- {} -| values: {} (stream)".format(q, args)
+
+        SQLiteDatabase.query_counter += 1
+
+        pcon = self.connect()
+        with pcon.lock:
+            cursor = pcon.con.cursor()
+            cursor.execute(q, args)
+
+        try:
+            while True:
+                with pcon.lock:
+                    rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def control(self, pcon, stmt):
+        """
+        (internal) execute transaction control statement 'stmt' using the 
+        connection 'pcon', these are not counted as queries
+        """
+        if self.debug:
+            print "[SQL]: |- {} -|".format(stmt)
+        pcon.con.execute(stmt)
+
+    @contextmanager
+    def atomic(self):
+        """
+        All queries inside the with-block are committed as one unit, on any
+        exception everything since entering the block is rolled back. 
+        Nested blocks are realized using SAVEPOINTs:
+
+        with db.atomic():
+            a.save()
+            with db.atomic():
+                b.save()
+        """
+
+        # the connection's lock is held for the whole transaction, so no 
+        # other thread sharing it is able to put its queries inside 
+        pcon = self.connect()
+        with pcon.lock:
+            depth = pcon.tx_depth
+            savepoint = "sp_{}".format(depth)
+            
+            # IMMEDIATE: acquire the write-lock now (waiting, if needed), 
+            # upgrading a read-transaction later may fail without waiting
+            self.control(pcon, "BEGIN IMMEDIATE" if depth == 0 \
+                    else "SAVEPOINT " + savepoint)
+            pcon.tx_depth += 1
+            try:
+                yield self
+            except:
+                pcon.tx_depth = depth
+                if depth == 0:
+                    self.control(pcon, "ROLLBACK")
+                else:
+                    self.control(pcon, "ROLLBACK TO " + savepoint)
+                    self.control(pcon, "RELEASE " + savepoint)
+                raise
+            
+            pcon.tx_depth = depth
+            self.control(pcon, "COMMIT" if depth == 0 \
+                    else "RELEASE " + savepoint)
+
+    # 'transaction' reads better for the outermost block
+    transaction = atomic
+
+    def query_many(self, q, seq):
+        """
+        Perform the (non-select) query 'q' once for each tupel of variables
+        inside 'seq' using a single executemany() call wrapped into one
+        transaction. Returns the rowid of the last inserted row.
+        """
+
+        if self.debug:
+            print "[SQL]: |- {} -| executemany".format(q)
+
+        SQLiteDatabase.query_counter += 1
+
+        pcon = self.connect()
+        with self.atomic():
+            cursor = pcon.con.cursor()
+            try:
+                cursor.executemany(q, seq)
+            except sqlite.IntegrityError as e:
+                raise IntegrityError(str(e))
+
+            # executemany() does not update 'cursor.lastrowid'
+            pcon.lastrowid = cursor.execute(
+                    "SELECT last_insert_rowid()").fetchone()[0]
+
+        return pcon.lastrowid
+
+    def compile_joins(self, cls, related):
+        """
+        (internal) return the additional select columns and LEFT JOIN clauses
+        to load the records referenced by the relation fields in 'related'
+        """
+        from fields import ManyToOneRelation, OneToOneRelation
+
+        cols, joins = "", ""
+        for name in related:
+            field = cls.base_fields.get(name)
+            if not isinstance(field, (ManyToOneRelation, OneToOneRelation)):
+                raise SQLiteDatabaseError("select_related() needs a n:1 " + \
+                        "or 1:1 relation field of {}, got: {}". \
+                        format(cls.__name__, name))
+            
+            # joined columns are named "<field>.<column>"
+            alias = "r_" + name
+            rel = field.rel_record
+            cols += ", {0}.rowid AS \"{1}.rowid\"".format(alias, name)
+            cols += "".join(", {0}.{2} AS \"{1}.{2}\"".format(alias, name, c) \
+                    for c in self.column_names(rel))
+            joins += " LEFT JOIN {} AS {} ON {}.rowid={}.{}".format(
+                    rel.table, alias, alias, cls.table, name)
+
+        return cols, joins
+
+    def statement(self, cls, act, cols):
+        """
+        (internal) return the (cached) INSERT or UPDATE (see 'act') statement
+        for the columns 'cols' of 'cls', an UPDATE takes the rowid as last 
+        value. A constant statement text lets sqlite reuse the prepared one.
+        """
+        key = (act, cols)
+        q = cls.stmt_cache.get(key)
+        if q is not None:
+            return q
+        
+        # --- UPDATE
+        if act == "update":
+            q = "UPDATE {} SET {} WHERE rowid=?".format(cls.table, 
+                    ",".join((x + "=?") for x in cols))
+        # --- INSERT
+        elif act == "insert" and not cols:
+            q = "INSERT INTO {} DEFAULT VALUES".format(cls.table)
+        elif act == "insert":
+            q = "INSERT INTO {} ({}) VALUES ({})".format(cls.table, 
+                    ",".join(cols), ",".join(["?"] * len(cols)))
+        else:
+            raise SQLiteDatabaseError("Unknown action: {}".format(act))
+
+        cls.stmt_cache[key] = q
+        return q
+
+    def load_joined(self, cls, row, related, lazy=False, batch=None):
+        """
+        (internal) construct instance of 'cls' and the joined instances for 
+        each relation field in 'related' from 'row'
+        """
+        names = row.keys()
+        obj = self.load_obj(cls, 
+                dict((k, row[k]) for k in names if not "." in k), lazy, batch)
+
+        for name in related:
+            # no referenced row (LEFT JOIN)
+            prefix = name + "."
+            if row[prefix + "rowid"] is None:
+                continue
+
+            field = obj.fields[name]
+            field.rel_obj = self.load_obj(field.rel_record, 
+                    dict((k[len(prefix):], row[k]) \
+                        for k in names if k.startswith(prefix)), lazy)
+        return obj
+
+    def save_obj(self, obj):
+        """
+        Either insert the object if "rowid" is found in table,
+        or update if rowid if found in the table
+        """
+        
+        # determine action (act) - either "update" or "insert"
+        act = "update" if obj.rowid else "insert"
+        
+        # a clean object is already in sync with the database
+        if act == "update" and not obj.dirty:
+            return True
+
+        # collect (and prepare) column/value pairs
+        attr_vals = self.prepare_obj(obj, act)
+
+        # nothing (with a column) changed
+        if act == "update" and not attr_vals:
+            self.finish_obj(obj, act)
+            return True
+        
+        # get the (cached) sql query 
+        q = self.statement(obj.__class__, act, 
+                tuple(x["col"] for x in attr_vals))
+        vals = [x["val"] for x in attr_vals]
+        if act == "update":
+            vals.append(obj.rowid)
+        
+        # executing constructed sql-query, keep the new rowid on insert
+        pcon = self.connect()
+        with pcon.lock:
+            ret = self.query(q, vals)
+            if act == "insert":
+                obj.rowid = pcon.lastrowid
+
+        if act == "insert" and self.identity_map() is not None:
+            self.identity_map().add(obj)
+        
+        # postprocess fields using Field::post_save()
+        self.finish_obj(obj, act)
+        return ret
+
+    def bulk_insert_objs(self, objs, batch_size=500):
+        """
+        Insert all (not yet saved) objects in 'objs'. Objects sharing the same
+        table and set of columns are inserted using a single executemany() 
+        for each chunk of 'batch_size' rows. The resulting rowids are 
+        assigned to the objects afterwards.
+        """
+
+        # group objects by table and column-set, keep the order of appearance
+        groups, order = {}, []
+        for obj in objs:
+            if obj.rowid:
+                raise SQLiteDatabaseError("Cannot bulk insert an " + \
+                        "already saved object: {}".format(obj))
+
+            attr_vals = self.prepare_obj(obj, "insert")
+            key = (obj.__class__, tuple(x["col"] for x in attr_vals))
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append((obj, [x["val"] for x in attr_vals]))
+
+        # the objects get their rowids, once all rows are committed, a 
+        # failing chunk rolls back all of them
+        rowids = []
+        with self.atomic():
+            for cls, cols in order:
+                rows = groups[(cls, cols)]
+                q = self.statement(cls, "insert", cols)
+                
+                for i in xrange(0, len(rows), batch_size):
+                    chunk = rows[i:i + batch_size]
+                    last_rowid = self.query_many(q, 
+                            [vals for obj, vals in chunk])
+                    
+                    # rows inserted by one executemany() (while holding 
+                    # the lock) get consecutive rowids
+                    first_rowid = last_rowid - len(chunk) + 1
+                    rowids += [(obj, first_rowid + j) \
+                            for j, (obj, vals) in enumerate(chunk)]
+
+        imap = self.identity_map()
+        for obj, rowid in rowids:
+            obj.rowid = rowid
+            self.finish_obj(obj, "insert")
+            if imap is not None:
+                imap.add(obj)
+        return True
+            
+    def bulk_update_objs(self, objs, batch_size=500):
+        """
+        Save the changed columns of all (already saved) objects in 'objs'.
+        Objects sharing the same table and set of changed columns are 
+        updated using a single executemany() for each chunk of 'batch_size'
+        rows.
+        """
+        groups, order, clean = {}, [], []
+        for obj in objs:
+            if not obj.rowid:
+                raise SQLiteDatabaseError("Cannot bulk update a not yet " + \
+                        "saved object: {}".format(obj))
+            if not obj.dirty:
+                continue
+
+            attr_vals = self.prepare_obj(obj, "update")
+            if not attr_vals:
+                clean.append(obj)
+                continue
+            key = (obj.__class__, tuple(x["col"] for x in attr_vals))
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append((obj, [x["val"] for x in attr_vals] + \
+                    [obj.rowid]))
+
+        # like bulk_insert_objs(), the objects are clean once committed
+        with self.atomic():
+            for cls, cols in order:
+                rows = groups[(cls, cols)]
+                q = self.statement(cls, "update", cols)
+                for i in xrange(0, len(rows), batch_size):
+                    self.query_many(q, [vals for obj, vals in \
+                            rows[i:i + batch_size]])
+
+        for cls, cols in order:
+            for obj, vals in groups[(cls, cols)]:
+                self.finish_obj(obj, "update")
+        for obj in clean:
+            self.finish_obj(obj, "update")
+        return True
+
+    def insert_rows(self, cls, columns, rows, batch_size=500):
+        """
+        Insert the tuples in 'rows' (values for 'columns') into the table of 
+        'cls' using one executemany() for each 'batch_size' rows, all inside
+        a single transaction. No instance of 'cls' is constructed, the values
+        are passed as they are. Returns the number of inserted rows.
+        """
+        columns = tuple(columns)
+        valid = self.column_names(cls)
+        if not columns or len(set(columns)) != len(columns) or \
+                any(not x in valid for x in columns):
+            raise SQLiteDatabaseError("Cannot insert the columns: {}, " \
+                    "availible are only: {}".format(", ".join(columns), 
+                        ", ".join(valid)))
+        
+        q = self.statement(cls, "insert", columns)
+        rows, count = iter(rows), 0
+        with self.atomic():
+            while True:
+                chunk = list(islice(rows, batch_size))
+                if not chunk:
+                    break
+                if any(len(row) != len(columns) for row in chunk):
+                    raise SQLiteDatabaseError("Each row needs exactly one " \
+                            "value for each column: {}". \
+                            format(", ".join(columns)))
+                self.query_many(q, chunk)
+                count += len(chunk)
+        return count
+
+    def delete_obj(self, obj):
+        """Delete given object from the SQLiteDatabase"""
+
+        if self.identity_map() is not None:
+            self.identity_map().remove(obj)
+
+        q = "DELETE FROM {} WHERE rowid=?".format(obj.table)
+        return self.query(q, (obj.rowid,))
+        
+    def filter(self, cls, operator="=", limit=None, order_by=None, 
+            after=None, related=None, where=None, lazy=False, deferred=None,
+            **kw):
+        """Return instances of 'cls' according to given values in 'kw' from
+        the SQLiteDatabase. 'after' may contain the key (values for the 
+        'order_by' columns or the rowid) of the last row seen, only rows 
+        following it are returned. The objects referenced by the (n:1 or 
+        1:1) relation fields named in 'related' are loaded within the same 
+        query using a JOIN. 'where' may contain additional conditions as 
+        (sql, values) pairs, see compile_condition(). 'lazy' instances 
+        construct their fields not before they are accessed. The columns 
+        'deferred' are not selected, these are loaded (for all instances at
+        once), when one is accessed, this implies 'lazy'.
+        """
+        q, vals = self.select_query(cls, operator, limit, order_by, after, 
+                related, where, kw, deferred=deferred)
+        batch = DeferredColumns(self, cls, deferred) if deferred else None
+        lazy = lazy or bool(deferred)
+        if related:
+            return [self.load_joined(cls, row, related, lazy, batch) \
+                    for row in self.query(q, vals)]
+        return [self.load_obj(cls, row, lazy, batch) \
+                for row in self.query(q, vals)]
+
+    def filter_iter(self, cls, operator="=", limit=None, order_by=None, 
+            after=None, related=None, where=None, chunk_size=500, 
+            lazy=False, deferred=None, **kw):
+        """
+        Same as filter(), but returns a generator streaming the result, 
+        i.e., only 'chunk_size' rows are kept in memory and each instance is
+        constructed not before it is needed. The 'deferred' columns are 
+        loaded for each chunk at once.
+        """
+        q, vals = self.select_query(cls, operator, limit, order_by, after, 
+                related, where, kw, deferred=deferred)
+        lazy = lazy or bool(deferred)
+        
+        def load(rows):
+            batch = None
+            for i, row in enumerate(rows):
+                if deferred and i % chunk_size == 0:
+                    batch = DeferredColumns(self, cls, deferred)
+                if related:
+                    yield self.load_joined(cls, row, related, lazy, batch)
+                else:
+                    yield self.load_obj(cls, row, lazy, batch)
+
+        return load(self.query_iter(q, vals, chunk_size))
+
+    def filter_values(self, cls, columns, limit=None, order_by=None, 
+            where=None, chunk_size=500):
+        """
+        Return a generator streaming the rows (only 'columns') selected like 
+        filter() would do, without constructing any instance of 'cls'
+        """
+        q, vals = self.select_query(cls, "=", limit, order_by, None, None, 
+                where, {}, mode="values", columns=columns)
+        return self.query_iter(q, vals, chunk_size)
+
+    def count(self, cls, operator="=", limit=None, where=None, **kw):
+        """Return the number of rows filter() would return (SQL-side)"""
+        q, vals = self.select_query(cls, operator, limit, None, None, None, 
+                where, kw, mode="count")
+        return self.query(q, vals)[0][0]
+
+    def exists(self, cls, operator="=", limit=None, where=None, **kw):
+        """Return True, if filter() would return at least one row"""
+        q, vals = self.select_query(cls, operator, limit, None, None, None, 
+                where, kw, mode="exists")
+        return len(self.query(q, vals)) > 0
+
+    def aggregate(self, cls, aggs, group_by=(), order_by=None, limit=None, 
+            where=None):
+        """
+        Return a list of dicts, one for each group of rows sharing the same
+        values in the columns 'group_by' (or one for all rows), containing 
+        these values and the results of the Aggregates in 'aggs' ({name: 
+        Aggregate}). No record object is constructed. With 'group_by', 
+        'order_by' (group columns, aggregate names) and 'limit' apply to 
+        the groups, otherwise to the aggregated rows.
+        """
+        names = sorted(aggs)
+        group_by = tuple(group_by)
+        order_by = tuple(order_by or ())
+
+        conds, vals = [], []
+        for sql, args in where or ():
+            conds.append(sql)
+            vals += args
+        if limit:
+            vals += limit
+
+        key = ("aggregate", tuple(conds), 
+                tuple((name, aggs[name].key()) for name in names), group_by,
+                order_by, bool(limit))
+        q = cls.stmt_cache.get(key)
+        if q is None:
+            q = cls.stmt_cache[key] = self.compile_aggregate(cls, conds, 
+                    [(name, aggs[name]) for name in names], group_by, 
+                    order_by, bool(limit))
+        
+        return [dict(zip(row.keys(), row)) for row in self.query(q, vals)]
+
+    def compile_aggregate(self, cls, where, aggs, group_by, order_by, limit):
+        """(internal) construct the SELECT statement text for aggregate()"""
+        
+        col = lambda x: "{}.{}".format(cls.table, x)
+        order = lambda name: ", ".join("{}{}".format(name(x.strip("+-")), 
+                " DESC" if x.startswith("-") else "") for x in order_by)
+        
+        columns = self.column_names(cls) + ["rowid"]
+        if any(not x in columns for x in group_by):
+            raise SQLiteDatabaseError("'group by' contains non column " + \
+                    "keys: {}, availible are only: {}". \
+                    format(", ".join(group_by), ", ".join(columns)))
+        
+        # groups are ordered by their columns and aggregates, rows by fields
+        keys = list(group_by) + [name for name, agg in aggs] if group_by \
+                else self.field_names(cls)
+        if any(not x.strip("+-") in keys for x in order_by):
+            raise SQLiteDatabaseError("'order by' contains unknown keys: " + \
+                    "{}, availible are only: {}". \
+                    format(", ".join(order_by), ", ".join(keys)))
+
+        cols = ["{} AS {}".format(col(x), x) for x in group_by] + \
+                ["{} AS {}".format(agg.to_sql(self, cls), name) \
+                    for name, agg in aggs]
+        cond = " WHERE {}".format(" AND ".join(where)) if where else ""
+        
+        # without groups, a limited selection is aggregated using a subquery 
+        if not group_by:
+            source = cls.table
+            if limit:
+                source = "(SELECT rowid, * FROM {0}{1}{2} LIMIT ?,?) AS {0}". \
+                        format(cls.table, cond, 
+                            " ORDER BY " + order(col) if order_by else "")
+                cond = ""
+            return "SELECT {} FROM {}{}".format(", ".join(cols), source, cond)
+        
+        q = "SELECT {} FROM {}{} GROUP BY {}".format(", ".join(cols), 
+                cls.table, cond, ", ".join(col(x) for x in group_by))
+        if order_by:
+            q += " ORDER BY " + order(lambda x: x)
+        if limit:
+            q += " LIMIT ?,?"
+        return q
+
+    def filter_in(self, cls, col, values):
+        """Return instances of 'cls' with one of 'values' in column 'col'"""
+        if not col in self.field_names(cls):
+            raise SQLiteDatabaseError("'{}' is not a field of {}". \
+                    format(col, cls.__name__))
+
+        key = ("in", col, len(values))
+        q = cls.stmt_cache.get(key)
+        if q is None:
+            q = cls.stmt_cache[key] = "SELECT rowid, * FROM {} WHERE {} " \
+                    "IN ({})".format(cls.table, col, ",".join("?" * len(values)))
+        return [self.load_obj(cls, row) for row in self.query(q, values)]
+
+    def prefetch_related(self, objs, names, chunk_size=500):
+        """
+        Load the related objects of the 1:n relation fields 'names' for all
+        record objects in 'objs' (of the same class) using one 'IN' query 
+        for each chunk of 'chunk_size' objects. The grouped objects are kept 
+        inside the relation field of each object in 'objs'.
+        """
+        from fields import OneToManyRelation
+
+        if not objs:
+            return
+        
+        cls = objs[0].__class__
+        rowids = list(set(obj.rowid for obj in objs))
+        for name in names:
+            field = cls.base_fields.get(name)
+            if not isinstance(field, OneToManyRelation):
+                raise SQLiteDatabaseError("prefetch_related() needs a 1:n " + \
+                        "relation field of {}, got: {}". \
+                        format(cls.__name__, name))
+
+            groups = dict((rowid, []) for rowid in rowids)
+            for i in xrange(0, len(rowids), chunk_size):
+                for rel in self.filter_in(field.rel_record, field.backref, 
+                        rowids[i:i + chunk_size]):
+                    groups[rel.fields[field.backref].get_save()].append(rel)
+
+            for obj in objs:
+                obj.fields[name].rel_objs = groups[obj.rowid]
+
+    def compile_condition(self, cls, kw, operator="=", negate=False):
+        """
+        (internal) return the (cached) sql condition comparing the fields in
+        'kw' to their values using 'operator' (AND-ed, optionally negated) 
+        and the list of values to be passed along
+        """
+       
+        # check if the passed keywords exist as field
+        all_fields = self.field_names(cls)
+        if any(not k in all_fields for k in kw):
+            raise SQLiteDatabaseError(".filter got a non-field keyword " + \
+                    "(one of: {}), instead of one of: '{}'". \
+                    format(", ".join(kw.keys()), ", ".join(all_fields)))
+                     
+        # postprocess the query keywords, sorted for a stable statement
+        from fields import ManyToOneRelation, OneToOneRelation
+        items = sorted(kw.items())
+        for i, (k, v) in enumerate(items):
+            if k in cls.base_fields and isinstance(cls.base_fields[k], 
+                    (ManyToOneRelation, OneToOneRelation)):
+                items[i] = (k, getattr(v, "rowid", v))
+                # if v else None <- no!, a rowid always exists!
+                # this MUST be true for all Fields in cls::base_fields
+        
+        vals = [v for k, v in items if v is not None]
+        
+        key = ("cond", operator, negate, 
+                tuple((k, v is None) for k, v in items))
+        sql = cls.stmt_cache.get(key)
+        if sql is None:
+            # uhu ugly-magic, actually just replacing the operator 
+            # with "IS NULL" if the kw value is None
+            null_op = " IS NOT NULL" if operator in ("<>", "!=") \
+                    else " IS NULL"
+            sql = " AND ".join("{}.{}{}".format(cls.table, k, 
+                    (operator + "?" if v is not None else null_op)) \
+                    for k, v in items)
+            if negate and sql:
+                sql = "NOT ({})".format(sql)
+            cls.stmt_cache[key] = sql
+
+        return sql, vals
+
+    def compile_conditions(self, cls, exprs, kw, negate=False):
+        """
+        (internal) return the tuple of (sql, values) conditions for the 
+        FieldExpressions 'exprs' and the 'kw' conditions (AND-ed, optionally 
+        negated), as kept inside QuerySet::where
+        """
+        conds = [self.compile_condition(cls, kw)] + \
+                [expr.to_sql(cls) for expr in exprs]
+        conds = [(sql, vals) for sql, vals in conds if sql]
+        if not negate or not conds:
+            return tuple(conds)
+        
+        return (("NOT ({})".format(" AND ".join("(" + sql + ")" \
+                    for sql, vals in conds)), 
+                 [x for sql, vals in conds for x in vals]),)
+
+    def select_query(self, cls, operator, limit, order_by, after, related, 
+            where, kw, mode="objects", deferred=None, columns=None):
+        """
+        (internal) return (cached) SELECT query and its values for filter(),
+        'mode' may also be "count", "exists" or "values" (only 'columns')
+        """
+
+        # use 'kw'-dict and the conditions in 'where' as WHERE CLAUSE
+        cond, vals = self.compile_condition(cls, kw, operator)
+        conds = [cond] if cond else []
+        for sql, args in where or ():
+            conds.append(sql)
+            vals += args
+
+        # --- keyset (seek) pagination: only rows following the key 'after'
+        seek = None
+        if after is not None:
+            keys = order_by or ("rowid",)
+            if len(after) != len(keys):
+                raise SQLiteDatabaseError("'after' needs exactly one " + \
+                        "value for each key: {}".format(", ".join(keys)))
+            
+            seek, positions = self.compile_seek(cls, keys, 
+                    tuple(x is None for x in after))
+            vals += [after[i] for i in positions]
+        
+        # --- LIMIT
+        if limit:
+            vals += limit
+        
+        key = ("select", mode, tuple(conds), tuple(order_by or ()), 
+                seek, bool(limit), tuple(related or ()), 
+                tuple(deferred or ()), tuple(columns or ()))
+        q = cls.stmt_cache.get(key)
+        if q is None:
+            q = cls.stmt_cache[key] = self.compile_select(cls, conds, 
+                    order_by, seek, bool(limit), related, mode,
+                    deferred, columns)
+        
+        return q, vals
+
+    def compile_seek(self, cls, keys, nulls):
+        """
+        (internal) return the (cached) condition selecting the rows ordered
+        behind a key, i.e., the values for the order_by 'keys' ('nulls' 
+        flags the ones being NULL), and the positions of the key values to
+        be passed along. Like sqlite, NULL is sorted first (last, if 
+        descending), so a NULL value is compared using IS (NOT) NULL.
+        """
+        key = ("seek", tuple(keys), nulls)
+        out = cls.stmt_cache.get(key)
+        if out is not None:
+            return out
+
+        cols = ["{}.{}".format(cls.table, x.strip("+-")) for x in keys]
+        descs = [x.startswith("-") for x in keys]
+
+        def equal(i):
+            if nulls[i]:
+                return cols[i] + " IS NULL", []
+            return cols[i] + "=?", [i]
+
+        def behind(i):
+            if nulls[i]:
+                return (None, []) if descs[i] else \
+                        (cols[i] + " IS NOT NULL", [])
+            if descs[i]:
+                return "({0}<? OR {0} IS NULL)".format(cols[i]), [i]
+            return cols[i] + ">?", [i]
+
+        # (a > ?) OR (a = ? AND b > ?) OR ... respecting each direction
+        alts, positions = [], []
+        for i in xrange(len(keys)):
+            sql, pos = behind(i)
+            if sql is None:
+                continue
+            terms = [equal(j) for j in xrange(i)] + [(sql, pos)]
+            alts.append("(" + " AND ".join(s for s, p in terms) + ")")
+            positions += [x for s, p in terms for x in p]
+        sql = "({})".format(" OR ".join(alts)) if alts else "0"
+
+        # the leading (redundant) range on 'a' allows index usage
+        if descs[0] and nulls[0]:
+            sql = "{} IS NULL AND {}".format(cols[0], sql)
+        elif not descs[0] and not nulls[0]:
+            sql = "{}>=? AND {}".format(cols[0], sql)
+            positions.insert(0, 0)
+
+        out = cls.stmt_cache[key] = (sql, positions)
+        return out
+
+    def compile_select(self, cls, where, order_by, after, limit, 
+            related=None, mode="objects", deferred=None, columns=None):
+        """(internal) construct the SELECT statement text for select_query()"""
+        
+        # all columns are qualified, as joined tables may share column names
+        col = lambda x: "{}.{}".format(cls.table, x)
+        where = list(where)
+        
+        # --- ORDER BY
+        all_fields = self.field_names(cls)
+        if order_by:
+            if any(not x.strip("+-") in all_fields for x in order_by):
+                raise SQLiteDatabaseError("'order by' contains non field " + \
+                        "keys: {}, availible are only: {}". \
+                        format(", ".join(order_by), ", ".join(all_fields)) )
+
+        # --- keyset (seek) pagination: 'after' is the condition, see 
+        # compile_seek()
+        if after:
+            where.append(after)
+            order_by = order_by or ("rowid",)
+
+        # the selected columns, counting (a limited result) needs a subquery
+        cols, joins = self.compile_joins(cls, related or ())
+        if mode == "objects" and deferred:
+            cols = ", ".join(["{} AS rowid".format(col("rowid"))] + \
+                    ["{} AS {}".format(col(x), x) \
+                        for x in self.column_names(cls) if not x in deferred]
+                    ) + cols
+        elif mode == "objects":
+            cols = "{0}.rowid AS rowid, {0}.*{1}".format(cls.table, cols)
+        elif mode == "values":
+            all_columns = self.column_names(cls) + ["rowid"]
+            if any(not x in all_columns for x in columns):
+                raise SQLiteDatabaseError("'values' contains non column " + \
+                        "keys: {}, availible are only: {}". \
+                        format(", ".join(columns), ", ".join(all_columns)))
+            cols = ", ".join("{} AS {}".format(col(x), x) for x in columns)
+        elif limit:
+            cols = col("rowid")
+        else:
+            cols = "COUNT(*)" if mode == "count" else "1"
+            order_by = None
+
+        q = "SELECT {} FROM {}{}".format(cols, cls.table, joins)
+        if where:
+            q += " WHERE {}".format(" AND ".join(where))
+        
+        if order_by:
+            q += " ORDER BY {}".format(
+                    ", ".join("{}{}".format(col(x.strip("+-")), " DESC" \
+                            if x.startswith("-") else "") \
+                            for x in order_by))
+        
+        # --- LIMIT
+        if limit:
+            q += " LIMIT ?,?"
+        
+        if mode == "count" and limit:
+            q = "SELECT COUNT(*) FROM ({})".format(q)
+        elif mode == "exists":
+            q = "SELECT 1 FROM ({}) LIMIT 1".format(q) if limit \
+                    else q + " LIMIT 1"
+
+        return q
+
+class Index(object):
+    """
+    Index on the column fields 'names' of a record (a leading "-" sorts 
+    descending), declared using the record class attribute 'indexes'. 
+    'unique' forbids duplicate entries, 'where' (sql condition) creates a 
+    partial index, covering only the matching rows:
+
+    class Book(BaseRecord):
+        ...
+        indexes = [Index("author", "-pub_date"), 
+                   Index("isbn", unique=True, where="isbn <> ''")]
+    """
+
+    def __init__(self, *names, **kw):
+        self.names = names
+        self.unique = kw.pop("unique", False)
+        self.where = kw.pop("where", None)
+        self.name = kw.pop("name", None)
+        
+        if not names:
+            raise DatabaseError("An Index needs at least one field")
+        if kw:
+            raise DatabaseError("Keyword(s): {} unsupported by Index". \
+                    format(", ".join(kw)))
+
+    def __repr__(self):
+        return "Index({})".format(", ".join(self.names))
+
+    def get_create(self, db, cls):
+        """Return the CREATE INDEX statement, checked against 'cls'"""
+        columns = db.column_names(cls) + ["rowid"]
+        cols = [x.lstrip("+-") for x in self.names]
+        if any(not x in columns for x in cols):
+            raise SQLiteDatabaseError("{!r} contains non column keys, " \
+                    "availible are only: {}".format(self, ", ".join(columns)))
+        
+        # "_" inside the table and column names is doubled, so each set of 
+        # columns gets its own name: (a_b) -> idx_t_a__b, (a, b) -> idx_t_a_b
+        name = self.name or "_".join(x.replace("_", "__") for x in 
+                ["uidx" if self.unique else "idx", cls.table] + cols)
+        q = "CREATE {}INDEX IF NOT EXISTS {} ON {} ({})".format(
+                "UNIQUE " if self.unique else "", name, cls.table, 
+                ", ".join(x + (" DESC" if n.startswith("-") else "") \
+                    for x, n in zip(cols, self.names)))
+        if self.where:
+            q += " WHERE {}".format(self.where)
+        return q
+
+class Aggregate(object):
+    """
+    SQL aggregate function over the (column) field 'field' (or all rows:
+    "*"), optionally only taking 'distinct' values into account:
+
+    Book.objects.aggregate(n=Count(), authors=Count("author", distinct=True))
+    Book.objects.group_by("author").annotate(first=Min("pub_date"))
+    """
+    
+    # sql function name, set by the subclasses
+    func = None
+
+    # only numeric fields can be summed up or averaged
+    numeric = False
+
+    def __init__(self, field="*", distinct=False):
+        self.field = field
+        self.distinct = distinct
+
+    def __repr__(self):
+        return "{}({}{})".format(self.__class__.__name__, self.field, 
+                ", distinct=True" if self.distinct else "")
+
+    def key(self):
+        """(internal) return a hashable identification of this aggregate"""
+        return (self.func, self.field, self.distinct)
+
+    def to_sql(self, db, cls):
+        """(internal) return the sql expression, checked against 'cls'"""
+        from fields import IntegerField, FloatField
+
+        if self.field == "*":
+            if self.distinct or self.func != "COUNT":
+                raise SQLiteDatabaseError("{!r} needs a field".format(self))
+            return "COUNT(*)"
+        
+        if not self.field in db.column_names(cls) + ["rowid"]:
+            raise SQLiteDatabaseError("{!r}: '{}' is not a column field " \
+                    "of {}".format(self, self.field, cls.__name__))
+
+        if self.numeric and self.field != "rowid" and not isinstance(
+                cls.base_fields[self.field], (IntegerField, FloatField)):
+            raise SQLiteDatabaseError("{!r} needs a numeric field, '{}' " \
+                    "is a {}".format(self, self.field, 
+                        cls.base_fields[self.field].__class__.__name__))
+
+        return "{}({}{}.{})".format(self.func, 
+                "DISTINCT " if self.distinct else "", cls.table, self.field)
+
+class Count(Aggregate):
+    func = "COUNT"
+
+class Sum(Aggregate):
+    func = "SUM"
+    numeric = True
+
+class Avg(Aggregate):
+    func = "AVG"
+    numeric = True
+
+class Min(Aggregate):
+    func = "MIN"
+
+class Max(Aggregate):
+    func = "MAX"
+
+class QuerySet(object):
+    """
+    Lazy, chainable selection of record objects as returned by the 
+    DataManager. Composing a QuerySet does not touch the database, the 
+    query is performed, once the objects are needed (iteration, indexing):
+
+    books = Book.objects.filter(author=a1).exclude(isbn="")
+    books.count()    # SELECT COUNT(*) ...
+    books.exists()   # SELECT 1 ... LIMIT 1
+    books[10:20]     # still lazy, LIMIT 10,10
+    for book in books.order_by("-pub_date"): 
+        ...          # SELECT rowid, * ... ORDER BY pub_date DESC
+    """
+
+    def __init__(self, manager, where=(), ordering=None, limit=None, 
+            grouping=()):
+        self.manager = manager
+        self.record = manager.record
+        
+        # tuple of conditions, see Database::compile_conditions()
+        self.where = where
+
+        # tuple of fieldnames to group the rows by, see annotate()
+        self.grouping = grouping
+
+        # tuple of fieldnames with a leading "+" or "-", see DataManager
+        self.ordering = ordering
+
+        # tuple (offset, count), count may be -1 (i.e., no limit)
+        self.limit = limit
+
+        # the result, once it was fetched
+        self.result = None
+
+    def clone(self, **kw):
+        """(internal) return a (not yet fetched) copy, updated by 'kw'"""
+        args = {"manager": self.manager, "where": self.where, 
+                "ordering": self.ordering, "limit": self.limit, 
+                "grouping": self.grouping}
+        args.update(kw)
+        return QuerySet(**args)
+
+    def fetch(self):
+        """(internal) return the result list, query it, if needed"""
+        if self.result is None:
+            self.result = self.manager.finish(self.record.database.filter(
+                self.record, limit=self.limit, order_by=self.ordering, 
+                related=self.manager.related, where=self.where, 
+                lazy=self.manager.lazy_load, deferred=self.manager.deferred))
+        return self.result
+
+    def all(self):
+        """Return a copy of this QuerySet"""
+        return self.clone()
+
+    def conditions(self, exprs, kw, negate=False):
+        """(internal) compile FieldExpressions 'exprs' and 'kw' conditions"""
+        return self.record.database.compile_conditions(self.record, exprs, 
+                kw, negate)
+
+    def filter(self, *exprs, **kw):
+        """
+        Return QuerySet with the additional (AND-ed) conditions in 'kw' and
+        in the FieldExpressions 'exprs', which are compiled into sql:
+        Book.objects.filter((Book.pub_date > t) & (Book.isbn != ""))
+        """
+        return self.clone(where=self.where + self.conditions(exprs, kw))
+
+    def exclude(self, *exprs, **kw):
+        """Return QuerySet without the objects matching all conditions"""
+        return self.clone(where=self.where + 
+                self.conditions(exprs, kw, negate=True))
+
+    def order_by(self, *keys):
+        """Return QuerySet ordered by 'keys' (fieldnames, "-" -> descending)"""
+        return self.clone(ordering=keys)
 
-    def setup_relations(self):
-        """Setup inter-field relations"""
-        from fields import AbstractRelationField
+    def select_related(self, *names):
+        """see DataManager.select_related()"""
+        return self.clone(manager=self.manager.select_related(*names))
 
-        # first go over all to gather relation-fields
-        relation_fields = []
-        for rec in self.contributed_records:
-            for k, v in rec.base_fields.items():
-                if issubclass(v.__class__, AbstractRelationField):
-                    v.setup_relation(rec)
+    def prefetch_related(self, *names):
+        """see DataManager.prefetch_related()"""
+        return self.clone(manager=self.manager.prefetch_related(*names))
 
-    def create_tables(self):
-        """Check for all 'cls', if we need to create the needed table"""
-        
-        # finally create all tables inside the SQLiteDatabase
-        for rec in self.contributed_records:             
-            # there is no 'show tables' sql-statement in sqlite,
-            # so query sqlite_master
-            q = "SELECT * FROM sqlite_master WHERE type='table' AND " + \
-                    "tbl_name='{}'".format(rec.table)
-            res = self.query(q)
-            
-            # table was found - skip creation...
-            if len(res) == 1:
-                if self.debug:
-                    print "[i] table: {} exists---skipping...".format(rec.table)
-                continue
+    def lazy(self):
+        """see DataManager.lazy()"""
+        return self.clone(manager=self.manager.lazy())
 
-            ## here we haven't found the table
-            # first check for field-number > 0
-            if len(rec.base_fields) == 0:
-                raise SQLiteDatabaseError("Could not create table: {}, " + \
-                        "no fields!".format(rec.table))
+    def only(self, *names):
+        """see DataManager.only()"""
+        return self.clone(manager=self.manager.only(*names))
 
-            # actual creation of create-table-query 
-            q = "CREATE TABLE {} ({})". \
-                    format(rec.table, ", ".join(x.get_create() \
-                        for x in rec.base_fields.values() \
-                            if x.name and x.get_create() not in ["", (), None])
-                    )
-            self.query(q)
-       
-    def query(self, q, args=()):
+    def defer(self, *names):
+        """see DataManager.defer()"""
+        return self.clone(manager=self.manager.defer(*names))
+
+    def count(self):
+        """Return the number of objects, using SELECT COUNT(*)"""
+        if self.result is not None:
+            return len(self.result)
+        return self.record.database.count(self.record, limit=self.limit, 
+                where=self.where)
+
+    def exists(self):
+        """Return True, if there is at least one object"""
+        if self.result is not None:
+            return len(self.result) > 0
+        return self.record.database.exists(self.record, limit=self.limit, 
+                where=self.where)
+
+    def aggregate(self, **aggs):
         """
-        Actually performing a query. Replace variables in 'q' with "?" and
-        pass the variables in the second argument 'args' as tupel
+        Return a dict with the results of the Aggregates 'aggs' over all 
+        (selected) rows, computed inside the database:
+        Book.objects.filter(author=a1).aggregate(pages=Sum("pages"))
         """
-        
-        if self.debug:
-            print "[SQL]: |- {} -| values: {}".format(q, args)
+        return self.record.database.aggregate(self.record, aggs, 
+                order_by=self.ordering, limit=self.limit, where=self.where)[0]
 
-        self.query_counter += 1
-               
-        with self.lock:
-            if SQLiteDatabase.db_con is None:
-                SQLiteDatabase.db_con = sqlite.connect(SQLiteDatabase.db_file)
-            
-            # to return a dict for each row
-            SQLiteDatabase.db_con.row_factory = sqlite.Row
-            
-            # to auto-commit
-            SQLiteDatabase.db_con.isolation_level = None
-            
-            ### text-encoding 
-            #self.db_con.text_factory = sqlite.OptimizedUnicode
-            SQLiteDatabase.db_con.text_factory = unicode
-            
-            self.cursor = SQLiteDatabase.db_con.cursor()
-            self.cursor.execute(q, args)
-            self.lastrowid = self.cursor.lastrowid
+    def group_by(self, *names):
+        """Return QuerySet, which is grouped by 'names', see annotate()"""
+        return self.clone(grouping=names)
 
-            out = self.cursor.fetchall() if q.lower().startswith("select") \
-                    else True            
+    def annotate(self, **aggs):
+        """
+        Return a list of dicts, one for each group (see group_by()) with its
+        column values and the results of the Aggregates 'aggs':
+        Book.objects.group_by("author").annotate(n=Count()) 
+        -> [{"author": 1, "n": 12}, {"author": 2, "n": 3}, ...]
+        """
+        return self.record.database.aggregate(self.record, aggs, 
+                group_by=self.grouping, order_by=self.ordering, 
+                limit=self.limit, where=self.where)
 
-        return out
-           
-    def save_obj(self, obj):
+    def values(self, *names, **kw):
         """
-        Either insert the object if "rowid" is found in table,
-        or update if rowid if found in the table
+        Return a generator streaming a dict {column: value} for each row, 
+        containing the columns of the fields 'names' (rowid and all columns,
+        if empty), a field group is replaced by its columns ("pos__x", ...).
+        No record object is constructed, the values are the raw column 
+        values, e.g., a relation gives the related rowid. 'chunk_size' rows
+        are fetched at once.
+        """
+        cols, rows = self.rows(names, kw.pop("chunk_size", 500), kw)
+        return (dict(zip(cols, row)) for row in rows)
+
+    def values_list(self, *names, **kw):
+        """
+        Like values(), but streams a tuple for each row, using 'flat' the 
+        (single) column value itself:
+        Book.objects.filter(author=a1).values_list("title", flat=True)
         """
+        flat = kw.pop("flat", False)
+        cols, rows = self.rows(names, kw.pop("chunk_size", 500), kw)
+        if flat:
+            if len(cols) != 1:
+                raise DatabaseError("values_list(flat=True) needs exactly " + \
+                        "one column, got: {}".format(", ".join(cols)))
+            return (row[0] for row in rows)
+        return (tuple(row) for row in rows)
+
+    def to_numpy(self, fields=None, chunk_rows=10000, structured=False):
+        """
+        Return the numeric columns of 'fields' (rowid and all numeric columns,
+        if None) as dict of typed 1-D numpy arrays {column: array} or, using
+        'structured', as one structured array. The rows are fetched in 
+        chunks of 'chunk_rows' and copied into the preallocated arrays, no 
+        record object is constructed. NULL becomes NaN inside float columns,
+        any other column containing NULL raises a DatabaseError. Needs numpy
+        (optional dependency).
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            raise DatabaseError("to_numpy() needs numpy, which is not " + \
+                    "installed")
+        cols, types = self.numpy_types(fields)
         
-        # determine action (act) - either "update" or "insert"
-        act = "update" if obj.rowid else "insert"
+        def alloc(size, old=None, used=0):
+            """(re-)allocate the arrays, keep 'used' rows of 'old' ones"""
+            out = np.zeros(size, dtype=zip(cols, types)) if structured \
+                    else dict((c, np.zeros(size, dtype=t)) \
+                        for c, t in zip(cols, types))
+            for c in (cols if old is not None else ()):
+                out[c][:used] = old[c][:used]
+            return out
         
-        # prepare all fields to be saved using Field::pre_save()
-        for attr in obj.fields:
-            if not obj.fields[attr].pre_save(action=act, obj=obj):
-                raise SQLiteDatabaseError("Field::pre_save() for field " + \
-                        "'{}' with value '{}' failed". \
-                        format(attr, getattr(obj, attr)))
-     
-        # collect data (omit empty-fields, pseudo-fields)
-        attr_vals = [{"col": k, "val": v.get_save()} \
-                for k, v in obj.fields.items() \
-                    if v.get_save() not in ((), None)]
+        # the result may still grow after counting
+        out = alloc(self.count())
+        rows = self.record.database.filter_values(self.record, cols, 
+                limit=self.limit, order_by=self.ordering, where=self.where, 
+                chunk_size=chunk_rows)
+        used = 0
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            
+            end = used + len(chunk)
+            if end > len(out[cols[0]]):
+                out = alloc(end, out, used)
+            for i, (col, t) in enumerate(zip(cols, types)):
+                vals = [row[i] for row in chunk]
+                if t != "float64" and any(x is None for x in vals):
+                    raise DatabaseError("to_numpy() column '{}' contains " \
+                            "NULL, use a FloatField or exclude these rows". \
+                            format(col))
+                out[col][used:end] = vals
+            used = end
         
-        # replace BaseRecord descendants with their .rowid 
-        from baserecord import BaseRecord
-        for i in xrange(len(attr_vals)):
-            if issubclass(attr_vals[i]["val"].__class__, BaseRecord):
-                attr_vals[i]["val"] = attr_vals[i]["val"].rowid
+        if used < len(out[cols[0]]):
+            out = alloc(used, out, used)
+        return out
+
+    def numpy_types(self, fields):
+        """(internal) return the columns of 'fields' and their numpy types"""
+        from fields import IntegerField, FloatField, BooleanField
         
-        # construct the sql query 
-        # --- UPDATE
-        if act == "update":
-            fields = ",".join((x["col"] + "=?") for x in attr_vals)
-            q = "UPDATE {} SET {} WHERE rowid={}". \
-                    format(obj.table, fields, obj.rowid)
-        # --- INSERT
-        elif act == "insert":
-            fields = ",".join(x["col"] for x in attr_vals)
-            vals = ",".join(["?"] * len(attr_vals))
-            q = "INSERT INTO {} ({}) VALUES ({})". \
-                    format(obj.table, fields, vals)
+        if fields is None:
+            fields = ["rowid"] + [x for x in self.record.database. \
+                    column_names(self.record) if isinstance(
+                        self.record.base_fields[x], (IntegerField, FloatField))]
         
-        # executing constructed sql-query
-        ret = self.query(q, [x["val"] for x in attr_vals])    
+        cols, types = self.manager.columns(fields), []
+        for col in cols:
+            field = self.record.base_fields.get(col)
+            if col == "rowid":
+                types.append("int64")
+            elif isinstance(field, BooleanField):
+                types.append("bool")
+            elif isinstance(field, IntegerField):
+                types.append("int64")
+            elif isinstance(field, FloatField):
+                types.append("float64")
+            else:
+                raise DatabaseError("to_numpy() needs numeric fields, " + \
+                        "'{}' is a {}".format(col, field.__class__.__name__))
         
-        # postprocess fields using Field::post_save()
-        for attr in obj.fields:
-            if not obj.fields[attr].post_save(action=act, obj=obj):
-                raise SQLiteDatabaseError("Field::post_save() for field " + \
-                        "'{}' with value '{}' failed". \
-                        format(attr, getattr(obj, attr)))
-        return ret
-            
-    def delete_obj(self, obj):
-        """Delete given object from the SQLiteDatabase"""
+        if not cols:
+            raise DatabaseError("No column for the field(s): {}". \
+                    format(", ".join(fields)))
+        return cols, types
 
-        q = "DELETE FROM {} WHERE rowid=?".format(obj.table)
-        return self.query(q, (obj.rowid,))
+    def rows(self, names, chunk_size, kw):
+        """(internal) return the columns of 'names' and a stream of rows"""
+        if kw:
+            raise TypeError("unsupported keyword(s): {}". \
+                    format(", ".join(kw)))
         
-    def filter(self, cls, operator="=", limit=None, order_by=None, **kw):
-        """Return instances of 'cls' according to given values in 'kw' from
-        the SQLiteDatabase 
+        cols = self.manager.columns(names or 
+                ["rowid"] + self.record.database.column_names(self.record))
+        if not cols:
+            raise DatabaseError("No column for the field(s): {}". \
+                    format(", ".join(names)))
+        
+        return cols, self.record.database.filter_values(self.record, cols,
+                limit=self.limit, order_by=self.ordering, where=self.where, 
+                chunk_size=chunk_size)
+
+    def get(self, **kw):
         """
-       
-        # check if the passed keywords exist as field
-        all_fields = cls.base_fields.keys() + ["rowid"]
-        if any(not k in all_fields for k in kw):
-            raise SQLiteDatabaseError(".filter got a non-field keyword " + \
-                    "(one of: {}), instead of one of: '{}'". \
-                    format(", ".join(kw.keys()), ", ".join(all_fields)))
-                     
-        # postprocess the query keywords
-        from fields import ManyToOneRelation as n2n_relation
-        from baserecord import BaseRecord
-        for k, v in kw.items():
-            if k in cls.base_fields \
-                  and isinstance(cls.base_fields[k], n2n_relation):
-                kw[k] = v.rowid 
-                # if v else None <- no!, a rowid always exists!
-                # this MUST be true for all Fields in cls::base_fields
+        Returns exactly one object if found or None. 
+        raises an SQLiteDatabaseError, if more than one is found
+        """
+        ret = list((self.filter(**kw) if kw else self)[:2])
+
+        if len(ret) == 1:
+            return ret[0]
+        elif len(ret) > 1:
+            raise SQLiteDatabaseError("Got more than one row from: {}". \
+                    format(kw))
         
-        # use 'kw'-dict as WHERE CLAUSE
-        if kw:
-            # uhu ugly-magic, actually just replacing the operator 
-            # with "IS NULL" if the kw value is None
-            where = " AND ".join("{}{}". \
-                format(k, (operator + "?" if v is not None \
-                    else " IS NULL")) \
-                for k, v in kw.items()
-            )
-            
-            q = "SELECT rowid, * FROM {} WHERE {}".format(cls.table, where)
+        # not found - return None
+        return None
+
+    def afetch(self):
+        """
+        Return the Future of the result list, queried without blocking the
+        calling thread, see Database::submit()
+        """
+        return self.record.database.submit(self.fetch)
+
+    def aget(self, **kw):
+        """Same as get(), but returns the Future of the object (or None)"""
+        return self.record.database.submit(self.get, **kw)
+
+    def acount(self):
+        """Same as count(), but returns the Future of the number"""
+        return self.record.database.submit(self.count)
 
-        # or simply select all
+    def iterator(self, chunk_size=500):
+        """Return a generator streaming the objects (nothing is cached)"""
+        return self.manager.finish_iter(self.record.database.filter_iter(
+                self.record, limit=self.limit, order_by=self.ordering, 
+                related=self.manager.related, where=self.where, 
+                chunk_size=chunk_size, lazy=self.manager.lazy_load, 
+                deferred=self.manager.deferred), chunk_size)
+
+    def sub_limit(self, start, stop):
+        """(internal) return the limit for [start:stop] applied to this one"""
+        offset, count = self.limit or (0, -1)
+        start = offset + start
+        if stop is None:
+            stop = (offset + count) if count >= 0 else None
         else:
-            q = "SELECT rowid, * FROM {}".format(cls.table)    
-        
-        # --- ORDER BY
-        if order_by:
-            if any(not x.strip("+-") in all_fields for x in order_by):
-                raise SQLiteDatabaseError("'order by' contains non field " + \
-                        "keys: {}, availible are only: {}". \
-                        format(", ".join(order_by), ", ".join(all_fields)) )
-        
-            q += " ORDER BY {}".format(
-                    ", ".join("{}{}".format(x[0], " DESC" \
-                            if x[1].startswith("-") else "") \
-                            for x in order_by))
-        
-        # --- LIMIT
-        if limit:
-            q += " LIMIT %s,%s" % limit
+            stop = offset + stop 
+            if count >= 0:
+                stop = min(stop, offset + count)
+        return (start, max(0, stop - start) if stop is not None else -1)
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    def __len__(self):
+        return self.count()
+
+    def __nonzero__(self):
+        return self.exists()
+
+    def __getitem__(self, key):
+        """
+        Behave like a list of objects, a non-negative index queries just 
+        this object, slices return a (lazy) QuerySet
+        """
+        if self.result is not None:
+            return self.result[key]
+
+        if isinstance(key, slice):
+            if key.step is not None or (key.start or 0) < 0 or \
+                    (key.stop is not None and key.stop < 0):
+                return self.fetch()[key]
+            return self.clone(limit=self.sub_limit(key.start or 0, key.stop))
+
+        if not isinstance(key, (int, long)):
+            raise TypeError("'{}' (type: {}) is not a valid index". \
+                    format(str(key), key.__class__.__name__))
         
-        vals = [x for x in kw.values() if x is not None] if kw else []      
-        return [cls(**kw) for kw in self.query(q, vals)]
+        if key < 0:
+            return self.fetch()[key]
+
+        ret = self.clone(limit=self.sub_limit(key, key + 1)).fetch()
+        if not ret:
+            raise IndexError("QuerySet index out of range")
+        return ret[0]
+
+    def __repr__(self):
+        return repr(self.fetch())
 
 class DataManager(object):
     """Object managing class placed as AnyRecord.objects"""
     def __init__(self, rec, pre_filter={}, order_by=None, 
-            limit=None, op_mode=None):
+            limit=None, op_mode=None, related=None, prefetch=None, 
+            lazy_load=False, deferred=None):
 
         self.record = rec
         self.pre_filter = pre_filter
 
+        # construct the fields of the loaded objects once accessed
+        self.lazy_load = lazy_load
+
+        # names of columns not to be selected, but loaded once accessed
+        self.deferred = deferred
+
+        # names of relation fields to be loaded together with each record 
+        self.related = related
+
+        # names of 1:n relation fields to be loaded for each result at once
+        self.prefetch = prefetch
+
         # order_by must be a tuple of fieldnames with a leading "+" or "-", 
         # no operator implies "+"
         self.order_by = order_by
@@ -326,53 +2833,330 @@ class DataManager(object):
     def __getitem__(self, key):
         """
         Behave like a list of objects, 'key' is a non-database/result-only 
-        related up counting index
+        related up counting index, slices return a (lazy) QuerySet
+        """
+        return self.all()[key]
+    
+    def store(self, *objs):
+        """
+        Keep the new or changed record objects 'objs' (and their not yet 
+        saved related objects) inside the current unit of work, to be saved
+        later at once, see Database::unit_of_work(). Without a unit of work,
+        these are saved immediately (still at once).
         """
+        db = self.record.database
+        uow = db.current_unit_of_work()
+        if uow is None:
+            uow = UnitOfWork(db)
+            for obj in objs:
+                uow.keep(obj)
+            uow.flush()
+            return
 
-        # implement slicing! TODO FIXME
-        if not isinstance(key, (int, long)):
-            raise TypeError("'{}' (type: {}) is not a valid index". \
-                    format(str(key), key.__class__.__name__))
+        for obj in objs:
+            uow.add(obj)
+
+    def bulk_create(self, objs, batch_size=500):
+        """
+        Save all new record objects in 'objs' at once, use this instead of
+        calling obj.save() for (lots of) fresh objects. Returns the objects
+        with their 'rowid' set.
+        """
 
-        # slice -> .start .stop .step .... isinstance(key, slice)
+        objs = list(objs)
+        for obj in objs:
+            if not isinstance(obj, self.record):
+                raise DatabaseError("bulk_create() got an object of " + \
+                        "type: {}, needed: {}".format(obj.__class__.__name__,
+                            self.record.__name__))
 
-        return self.record.database.filter(self.record, limit=(key,1))[0]
-    
-    def store(self, owner, obj):
-        """here store temporary objects"""
-        
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        """here store temporary objects"""
-        pass
+        self.record.database.bulk_insert_objs(objs, batch_size=batch_size)
+        return objs
+
+    def load_rows(self, rows, columns=None, batch_size=500):
+        """
+        Insert the tuples in 'rows' as new rows without constructing any 
+        record object, each tuple contains a value for each of 'columns' 
+        (all columns in sorted order, if None). Everything is inserted in 
+        one transaction, using one executemany() for each 'batch_size' rows.
+        Returns the number of inserted rows.
+        """
+        db = self.record.database
+        return db.insert_rows(self.record, columns or 
+                db.column_names(self.record), rows, batch_size)
+
+    def load_columns(self, columns, batch_size=500):
+        """
+        Insert new rows from the sequences (lists, numpy arrays, ...) of 
+        equal length in 'columns' ({column: values}), see load_rows():
+        HeadTrackData.objects.load_columns({"pos__x": xs, "pos__y": ys})
+        """
+        names = sorted(columns)
+        values = [columns[x] for x in names]
+        size = len(values[0]) if values else 0
+        if any(len(x) != size for x in values):
+            raise DatabaseError("load_columns() needs the same number of " + \
+                    "values for each column: {}".format(", ".join(names)))
+
+        def rows():
+            for i in xrange(0, size, batch_size):
+                # numpy types are converted to their python types
+                chunk = [x[i:i + batch_size] for x in values]
+                for row in zip(*[x.tolist() if hasattr(x, "tolist") else x \
+                        for x in chunk]):
+                    yield row
+        
+        return self.record.database.insert_rows(self.record, names, rows(), 
+                batch_size)
+
+    def select_related(self, *names):
+        """
+        Returns a DataManager, which loads the objects referenced by the 
+        (n:1 or 1:1) relation fields 'names' using the same (JOIN) query:
+        
+        for book in Book.objects.select_related("author").all():
+            print book.author.name   # <- no additional query
+        """
+        return self.clone(related=tuple(self.related or ()) + names)
+
+    def prefetch_related(self, *names):
+        """
+        Returns a DataManager, which loads the objects of the 1:n relation
+        fields (backrefs) 'names' for all objects of a result at once, using
+        (chunked) 'IN' queries:
+
+        for author in Author.objects.prefetch_related("books").all():
+            print len(author.books)   # <- no additional query
+        """
+        return self.clone(prefetch=tuple(self.prefetch or ()) + names)
+
+    def lazy(self):
+        """
+        Returns a DataManager, which loads lazy objects: these keep their 
+        database row and construct a field (group) not before it is 
+        accessed, use this to read few fields of wide records:
+
+        for data in HeadTrackData.objects.lazy().all():
+            print data.pos     # <- only 'pos' (and its fields) are built
+        """
+        return self.clone(lazy_load=True)
+
+    def columns(self, names, deferred=False):
+        """
+        (internal) return the column names of the fields 'names', a field 
+        group is replaced by its columns, a primary key is never 'deferred'
+        """
+        db = self.record.database
+        out = []
+        for name in names:
+            if name == "rowid":
+                out.append(name)
+                continue
+            if not name in self.record.base_fields:
+                raise DatabaseError("'{}' is not a field of {}". \
+                        format(name, self.record.__name__))
+            out += [x for x in db.column_names(self.record) \
+                    if x == name or x.startswith(name + "__")]
+        if not deferred:
+            return out
+        return [x for x in out if x != "rowid" and \
+                not self.record.base_fields[x].primary_key]
+
+    def only(self, *names):
+        """
+        Returns a DataManager, which selects just the columns of the fields
+        'names' (and the rowid). Accessing another field of a loaded object
+        selects the missing columns for all objects of this result at once:
+
+        for book in Book.objects.only("title").all():
+            print book.title     # <- 'abstract' is not selected
+        """
+        keep = self.columns(names)
+        return self.clone(deferred=tuple(x for x in self.columns(
+            self.record.base_fields, deferred=True) if not x in keep))
+
+    def defer(self, *names):
+        """
+        Returns a DataManager, which does not select the columns of the 
+        fields 'names', these are loaded once accessed, see only()
+        """
+        return self.clone(deferred=tuple(sorted(set(self.deferred or ()) | 
+            set(self.columns(names, deferred=True)))))
+
+    def clone(self, **kw):
+        """(internal) return a copy of this DataManager, updated by 'kw'"""
+        args = {"pre_filter": self.pre_filter, "order_by": self.order_by, 
+                "limit": self.limit, "op_mode": self.op_mode, 
+                "related": self.related, "prefetch": self.prefetch, 
+                "lazy_load": self.lazy_load, "deferred": self.deferred}
+        args.update(kw)
+        return DataManager(self.record, **args)
+
+    def finish(self, objs):
+        """(internal) postprocess a (list) result 'objs', returns 'objs'"""
+        if self.prefetch:
+            self.record.database.prefetch_related(objs, self.prefetch)
+        return objs
+
+    def finish_iter(self, it, chunk_size):
+        """
+        (internal) postprocess the objects streamed by 'it' in chunks of
+        'chunk_size' objects, see finish(), returns an iterator
+        """
+        if not self.prefetch:
+            return it
+        return self.finish_chunks(it, chunk_size)
+
+    def finish_chunks(self, it, chunk_size):
+        """(internal) finish_iter() implementation"""
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                return
+            for obj in self.finish(chunk):
+                yield obj
 
     def all(self):
-        """Return all Record objects from the SQLiteDatabase"""
-        return self.record.database.filter(self.record, limit=self.limit)
+        """Return (lazy) QuerySet of all Record objects"""
+        qs = QuerySet(self, ordering=self.order_by, limit=self.limit)
+        return qs.filter(**self.pre_filter) if self.pre_filter else qs
 
-    def filter(self, **kw):
+    def filter(self, *exprs, **kw):
         """
         This is the access method to all rows a.k.a. objects from the 
         SQLiteDatabase. use like this: 
         MyRecord.objects.filter(some_field="bar", other_field="foo")
+        MyRecord.objects.filter(MyRecord.some_field.isin(["bar", "foo"]))
+        Returns a (lazy) QuerySet.
         """
+        return self.all().filter(*exprs, **kw)
 
-        kw.update(self.pre_filter)
-        return self.record.database.filter(self.record, limit=self.limit, 
-                order_by=self.order_by, **kw)
+    def count(self, **kw):
+        """Return the number of rows matching 'kw' (SQL-side)"""
+        return self.filter(**kw).count()
+
+    def afilter(self, *exprs, **kw):
+        """
+        Same as filter(), but returns the Future of the result list, which 
+        is queried without blocking the calling thread:
+        
+        future = Book.objects.afilter(Book.pages > 100)
+        books = future.result()
+        """
+        return self.filter(*exprs, **kw).afetch()
+
+    def aget(self, **kw):
+        """Same as get(), but returns the Future of the object (or None)"""
+        return self.record.database.submit(self.get, **kw)
+
+    def acount(self, **kw):
+        """Same as count(), but returns the Future of the number"""
+        return self.filter(**kw).acount()
+    
+    def values(self, *names, **kw):
+        """Stream a dict for each row, see QuerySet.values()"""
+        return self.all().values(*names, **kw)
+
+    def values_list(self, *names, **kw):
+        """Stream a tuple (or value) for each row, see QuerySet.values_list()"""
+        return self.all().values_list(*names, **kw)
+
+    def to_numpy(self, fields=None, chunk_rows=10000, structured=False):
+        """Return numeric columns as numpy arrays, see QuerySet.to_numpy()"""
+        return self.all().to_numpy(fields, chunk_rows, structured)
+
+    def aggregate(self, **aggs):
+        """Return a dict with the results of 'aggs', see QuerySet.aggregate()"""
+        return self.all().aggregate(**aggs)
+
+    def group_by(self, *names):
+        """Return QuerySet grouped by 'names', see QuerySet.annotate()"""
+        return self.all().group_by(*names)
+
+    def annotate(self, **aggs):
+        """Return the results of 'aggs' for each group of rows as dicts"""
+        return self.all().annotate(**aggs)
     
-    def iterator(self, prefetch_rows=100, limit=None, **kw):
-        """Returns an iterator for the selected data"""
+    def stream(self, chunk_size=500, **kw):
+        """
+        Like filter(), but returns a generator, which fetches the rows in 
+        chunks of 'chunk_size' and constructs the objects lazily. Use this
+        to walk through large results using bounded memory.
+        """
+
+        kw.update(self.pre_filter)
+        return self.finish_iter(self.record.database.filter_iter(self.record,
+                limit=self.limit, order_by=self.order_by, 
+                related=self.related, chunk_size=chunk_size, 
+                lazy=self.lazy_load, deferred=self.deferred, **kw), chunk_size)
+
+    def row_key(self, obj, keys):
+        """(internal) return the values of the (order_by-)'keys' of 'obj'"""
+        from baserecord import BaseRecord
+
+        out = []
+        for key in keys:
+            col = key.strip("+-")
+            val = obj.rowid if col == "rowid" else obj.fields[col].get_save()
+            out.append(val.rowid if isinstance(val, BaseRecord) else val)
+        return tuple(out)
+
+    def iterator(self, prefetch_rows=100, limit=None, keyset=True, **kw):
+        """
+        Returns an iterator for the selected data. Using 'keyset' each chunk
+        of 'prefetch_rows' rows is selected by seeking behind the key of the
+        last row (order_by columns + rowid) instead of an ever-growing 
+        offset, so the cost per chunk stays the same for the whole table.
+        """
+
+        if keyset:
+            return self.keyset_iterator(prefetch_rows, limit, **kw)
+
+        return self.offset_iterator(prefetch_rows, limit, **kw)
+
+    def aiterator(self, prefetch_rows=100, limit=None, keyset=True, **kw):
+        """
+        Same as iterator(), but each chunk of 'prefetch_rows' objects is 
+        queried without blocking the calling thread, the next chunk is 
+        fetched while the current one is consumed, see AsyncIterator
+        """
+        return AsyncIterator(self.record.database.submit, 
+                self.iterator(prefetch_rows, limit, keyset, **kw), 
+                prefetch_rows)
+
+    def keyset_iterator(self, prefetch_rows=100, limit=None, **kw):
+        """(internal) iterator() implementation based on keyset pagination"""
+
+        # the rowid as last key makes any order unique
+        keys = tuple(self.order_by or ())
+        if not any(x.strip("+-") == "rowid" for x in keys):
+            keys += ("rowid",)
+        
+        # the offset is only applied to the first chunk
+        offset, left = limit or self.limit or (0, None)
+        after = None
+        
+        while left is None or left > 0:
+            count = prefetch_rows if left is None else min(prefetch_rows, left)
+            data = self.record.database.filter(self.record, 
+                    limit=(offset, count), order_by=keys, after=after, 
+                    related=self.related, lazy=self.lazy_load, 
+                    deferred=self.deferred, **kw)
+
+            for d in self.finish(data):
+                yield d
+            
+            # the last chunk is (most probably) not complete
+            if len(data) < count:
+                break
+            
+            if left is not None:
+                left -= len(data)
+            offset = 0
+            after = self.row_key(data[-1], keys)
+
+    def offset_iterator(self, prefetch_rows=100, limit=None, **kw):
+        """(internal) iterator() implementation based on LIMIT offset,count"""
 
         lim = limit or self.limit
         org_lim_length = None
@@ -391,14 +3175,16 @@ class DataManager(object):
         # generator loop
         while True:
             # query data
-            data = self.record.database.filter(self.record, limit=lim, **kw)
+            data = self.record.database.filter(self.record, limit=lim, 
+                    related=self.related, lazy=self.lazy_load, 
+                    deferred=self.deferred, **kw)
 
             # break, if there is no more data to iterate
             if len(data) == 0:
                 break
 
             # yield prefetched data
-            for d in data:
+            for d in self.finish(data):
                 got_rows += 1
                 yield d
 
@@ -418,7 +3204,7 @@ class DataManager(object):
 
         try:
             return self.get(**kw)
-        except SQLiteDatabaseError as e:
+        except DatabaseError as e:
             return None
 
     def get(self, **kw):
@@ -427,24 +3213,23 @@ class DataManager(object):
         raises an SQLiteDatabaseError, if more than one is found
         """
 
-        ret = self.all() if len(kw) == 0 else self.filter(**kw)
+        # inside a session, a rowid lookup may not need the database at all
+        if kw.keys() == ["rowid"] and not self.pre_filter:
+            imap = self.record.database.identity_map()
+            obj = imap.get(self.record.table, kw["rowid"]) \
+                    if imap is not None else None
+            if obj is not None:
+                return obj
 
-        if len(ret) == 1:
-            return ret[0]
-        elif len(ret) > 1:
-            raise SQLiteDatabaseError("Got more than one row from: {}". \
-                    format(kw))
-        
-        # not found - return None
-        return None
+        return self.all().get(**kw)
 
     def exists(self, **kw):
         """Checks for existance for a row with the given {key:value} pairs"""
-        return self.one(**kw) is not None
+        return self.filter(**kw).exists()
 
-    def exclude(self, **kw):
+    def exclude(self, *exprs, **kw):
         """Exclude the objects with match the keyword -> value combi passed"""
-        return self.filter(cls, operator="<>", **kw)
+        return self.all().exclude(*exprs, **kw)
 
     def create_or_get(self, **kw):
         """
@@ -183,6 +183,10 @@ b2.save()
 # backref + 1:N + N:1 works good
 print len(a1.books)
 
+# load the books together with their authors using a single (JOIN) query
+for book in Book.objects.select_related("author").all():
+    print book.title, "by", book.author.name
+
 # field group to transparently put any datastructure inside the db 
 m = MultiLevelData()
 m.pos = Coord(24,21,43)
@@ -210,8 +214,8 @@ print "multi-depth", m.pos, m.direction, m.info
 
 
 from_idx, to_idx = (9, 234)
-for i in xrange(from_idx, to_idx):
-    NumData(num=i).save()
+# many new objects are saved (much faster) at once using bulk_create()
+NumData.objects.bulk_create(NumData(num=i) for i in xrange(from_idx, to_idx))
 
 count = 0
 for row in NumData.objects.iterator():
@@ -0,0 +1,262 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+import sys
+from threading import Thread, Condition, Lock, local, current_thread
+from Queue import Queue, Full
+from itertools import islice
+
+__metaclass__ = type
+
+class ExecutorError(Exception):
+    pass
+
+class CancelledError(ExecutorError):
+    pass
+
+class Future(object):
+    """
+    The (later) result of a job submitted to an Executor. Wait for it using
+    result() or pass a callback, which is called (inside the worker thread)
+    once the job is done:
+
+    future = Book.objects.afilter(author=a)
+    future.add_done_callback(lambda f: loop.add_callback(show, f))
+    books = future.result(timeout=1.0)
+    """
+
+    def __init__(self):
+        self.cond = Condition()
+
+        # "pending" -> "running" -> "finished" or "cancelled"
+        self.state = "pending"
+        self.value = None
+        self.error = None
+        self.callbacks = []
+
+        # called by cancel() for a running job, e.g., to abort its query
+        self.interrupt = None
+        self.interrupted = False
+
+    def __repr__(self):
+        return "<Future state={}>".format(self.state)
+
+    def done(self):
+        """True, if the job is finished or was cancelled"""
+        return self.state in ("finished", "cancelled")
+
+    def running(self):
+        return self.state == "running"
+
+    def cancelled(self):
+        return self.state == "cancelled"
+
+    def cancel(self, timeout=None):
+        """
+        Cancel the job, a pending one is not going to run at all, a running
+        one only stops, if it can be interrupted: this waits (at most 
+        'timeout' seconds) for the job to end. Returns True, if the job
+        ended cancelled.
+        """
+        with self.cond:
+            if self.state == "running" and self.interrupt is not None:
+                self.interrupted = True
+                self.interrupt()
+
+                # the job finishes anyway, if no query was interrupted
+                if not self.done():
+                    self.cond.wait(timeout)
+                return self.state == "cancelled"
+            if self.state != "pending":
+                return self.state == "cancelled"
+            self.state = "cancelled"
+            self.cond.notify_all()
+        self.run_callbacks()
+        return True
+
+    def add_done_callback(self, fn):
+        """Call 'fn' with this future, once it is done"""
+        with self.cond:
+            if not self.done():
+                self.callbacks.append(fn)
+                return
+        fn(self)
+
+    def result(self, timeout=None):
+        """
+        Wait (at most 'timeout' seconds) for the job and return its result,
+        an exception raised by the job is raised here
+        """
+        with self.cond:
+            if not self.done():
+                self.cond.wait(timeout)
+            if not self.done():
+                raise ExecutorError("Job not done after {} seconds". \
+                        format(timeout))
+
+        if self.state == "cancelled":
+            raise CancelledError("Job was cancelled")
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
+
+    def set_running(self):
+        """(internal) mark the job as running, False if it was cancelled"""
+        with self.cond:
+            if self.state != "pending":
+                return False
+            self.state = "running"
+            return True
+
+    def set_result(self, value, error=None):
+        """(internal) keep the result (or the exc_info 'error') of the job"""
+        with self.cond:
+            self.interrupt = None
+            if error is not None and self.interrupted:
+                self.state = "cancelled"
+            else:
+                self.state = "finished"
+                self.value, self.error = value, error
+            self.cond.notify_all()
+        self.run_callbacks()
+
+    def run_callbacks(self):
+        """(internal) call each (once) added callback"""
+        callbacks, self.callbacks = self.callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+class Executor(object):
+    """
+    Runs the submitted jobs inside a fixed number of 'workers' threads. At
+    most 'max_pending' jobs wait for a free worker, submit() blocks (at most
+    'timeout' seconds) while all these slots are taken (backpressure):
+
+    executor = Executor(workers=2, max_pending=64)
+    future = executor.submit(db.query, "SELECT ...")
+    """
+
+    def __init__(self, workers=2, max_pending=64, timeout=None, name="db"):
+        self.queue = Queue(max_pending)
+        self.timeout = timeout
+        self.lock = Lock()
+        self.closed = False
+
+        # the future of the job running inside each worker, see current()
+        self.local = local()
+
+        self.threads = [Thread(target=self.work,
+            name="{}-executor-{}".format(name, i)) for i in xrange(workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, fn, *args, **kw):
+        """Run 'fn(*args, **kw)' inside a worker, return its Future"""
+        future = Future()
+
+        # a job must be queued before shutdown() queues the stop markers
+        with self.lock:
+            if self.closed:
+                raise ExecutorError("Cannot submit a job, executor is " \
+                        "shut down")
+            try:
+                self.queue.put((future, fn, args, kw), timeout=self.timeout)
+            except Full:
+                raise ExecutorError("Cannot submit a job, {} jobs are " \
+                        "pending".format(self.queue.maxsize))
+        return future
+
+    def current(self):
+        """Return the Future of the job running in this (worker) thread"""
+        return getattr(self.local, "future", None)
+
+    def work(self):
+        """(internal) run the jobs until the shutdown"""
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            future, fn, args, kw = job
+            if not future.set_running():
+                continue
+
+            self.local.future = future
+            try:
+                value = fn(*args, **kw)
+            except:
+                future.set_result(None, sys.exc_info())
+            else:
+                future.set_result(value)
+            finally:
+                self.local.future = None
+                job = future = None
+
+    def shutdown(self, wait=True):
+        """Stop the workers after all submitted jobs are done"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+
+        for thread in self.threads:
+            self.queue.put(None)
+        if wait:
+            for thread in self.threads:
+                if thread is not current_thread():
+                    thread.join()
+
+class AsyncIterator(object):
+    """
+    Iterate over the items of the iterator 'it', advanced using 'submit'
+    (e.g., Database::submit()) for each chunk of 'chunk_size' items. While
+    one chunk is consumed, the next one is already fetched, but never more.
+    'it' is advanced from several worker threads, one chunk at a time.
+    """
+
+    def __init__(self, submit, it, chunk_size=100):
+        self.submit = submit
+        self.it = it
+        self.chunk_size = chunk_size
+        self.ahead = None
+        self.finished = False
+
+    def fetch(self):
+        """(internal) return the next chunk (list) of items"""
+        return list(islice(self.it, self.chunk_size))
+
+    def next_chunk(self):
+        """
+        Return the Future of the next chunk (list) of items, an empty one
+        marks the end. The chunk following it is not fetched in advance.
+        """
+        future, self.ahead = self.ahead, None
+        if future is not None:
+            return future
+        if self.finished:
+            future = Future()
+            future.set_result([])
+            return future
+        return self.submit(self.fetch)
+
+    def cancel(self):
+        """Stop fetching, the prefetched chunk is cancelled (if possible)"""
+        self.finished = True
+        if self.ahead is not None:
+            self.ahead.cancel()
+            self.ahead = None
+
+    def __iter__(self):
+        while not self.finished:
+            chunk = self.next_chunk().result()
+            if not chunk:
+                self.finished = True
+                return
+
+            if len(chunk) == self.chunk_size:
+                self.ahead = self.submit(self.fetch)
+            else:
+                self.finished = True
+            for item in chunk:
+                yield item
@@ -3,6 +3,36 @@ import operator
 class FieldExpressionError(Exception):
     pass
 
+# operations without a python operator, see SkeletonField
+def isin(a, b):
+    """'a' is one of the items inside 'b'"""
+    return a in b
+
+def is_null(a):
+    """'a' is not set"""
+    return a is None
+
+def is_not_null(a):
+    """'a' is set"""
+    return a is not None
+
+# sql's three-valued logic, None stands for NULL, see to_func()
+def sql_and(a, b):
+    """'a' AND 'b', False beats None"""
+    if (a is not None and not a) or (b is not None and not b):
+        return False
+    return None if a is None or b is None else True
+
+def sql_or(a, b):
+    """'a' OR 'b', True beats None"""
+    if a or b:
+        return True
+    return None if a is None or b is None else False
+
+def sql_not(a):
+    """NOT 'a', None stays None"""
+    return None if a is None else not a
+
 class FieldExpression(object): 
     operator_map = {
     
@@ -22,9 +52,44 @@ class FieldExpression(object):
         operator.sub: "{} - {}",
         operator.mul: "{} * {}",
         operator.div: "{} / {}",
+        isin: "{} in {}",
+        is_null: "{} is None",
+        is_not_null: "{} is not None",
     }
 
-    operator_one_arg = set((len, operator.inv))
+    # sql templates, see to_sql()
+    sql_operator_map = {
+        operator.eq: "{} = {}",
+        operator.le: "{} <= {}",
+        operator.lt: "{} < {}",
+        operator.ne: "{} <> {}",
+        operator.gt: "{} > {}",
+        operator.ge: "{} >= {}",
+        operator.and_: "{} AND {}",
+        operator.or_:  "{} OR {}",
+        operator.inv: "NOT {}",
+        operator.add: "{} + {}",
+        operator.sub: "{} - {}",
+        operator.mul: "{} * {}",
+        operator.div: "{} / {}",
+        isin: "{} IN {}",
+        is_null: "{} IS NULL",
+        is_not_null: "{} IS NOT NULL",
+    }
+
+    operator_one_arg = set((len, operator.inv, is_null, is_not_null))
+
+    # python functions replacing the bitwise operators, see to_func()
+    func_operator_map = {
+        operator.and_: sql_and,
+        operator.or_: sql_or,
+        operator.inv: sql_not,
+    }
+
+    # operations resulting in None (NULL), if one argument is None
+    null_operators = set((operator.eq, operator.le, operator.lt, operator.ne,
+        operator.gt, operator.ge, operator.add, operator.sub, operator.mul, 
+        operator.div, isin))
 
     def __init__(self, arg1, arg2=None, op=None, obj1=None, obj2=None, context=None):
         self.context = context or {}
@@ -136,6 +201,124 @@ class FieldExpression(object):
         else:
             return tmpl.format(arg1, arg2)
      
+    def _prepare_sql_arg(self, arg, cls, vals, many=False):
+        from fields import AbstractField
+        from baserecord import BaseRecord
+
+        # arg == FieldExpression (recurse)
+        if isinstance(arg, FieldExpression):
+            sql, args = arg.to_sql(cls)
+            vals.extend(args)
+            return "(" + sql + ")"
+
+        # arg == AbstractField -> (qualified) column
+        elif isinstance(arg, AbstractField):
+            if cls.base_fields.get(arg.name) is not arg:
+                raise FieldExpressionError(
+                    "'{}' is not a field of: {}".format(arg.name, cls.__name__))
+            return "{}.{}".format(cls.table, arg.name)
+
+        # arg in self.context
+        elif not many and isinstance(arg, basestring) and arg in self.context:
+            arg = self.context[arg]
+        
+        # arg == others -> parameter(s), records are referenced by rowid
+        items = list(arg) if many else [arg]
+        vals.extend((x.rowid if isinstance(x, BaseRecord) else x) \
+                for x in items)
+        marks = ",".join("?" * len(items))
+        return "(" + marks + ")" if many else marks
+
+    def to_sql(self, cls):
+        """
+        Compile expression into a parameterized sql expression for the table
+        of the record class 'cls'. Returns the sql string and the list of 
+        values to be passed along: 
+        
+        (Book.pub_date > t) & (Book.isbn != "") 
+          -> ("(book.pub_date > ?) AND (book.isbn <> ?)", [t, ""])
+        """
+        vals = []
+        arg1 = self._prepare_sql_arg(self.arg1, cls, vals)
+
+        # 'arg1' may be alone and without 'op'
+        if self.op is None:
+            return arg1, vals
+
+        tmpl = self.sql_operator_map.get(self.op)
+        if tmpl is None:
+            raise FieldExpressionError("'{}' has no sql representation". \
+                    format(self.op.__name__))
+
+        if self.op in self.operator_one_arg:
+            return tmpl.format(arg1), vals
+        
+        arg2 = self._prepare_sql_arg(self.arg2, cls, vals, 
+                many=(self.op is isin))
+        return tmpl.format(arg1, arg2), vals
+
+    def _prepare_func_arg(self, arg, cls, columns, many=False):
+        from fields import AbstractField
+        from baserecord import BaseRecord
+
+        # arg == FieldExpression (recurse)
+        if isinstance(arg, FieldExpression):
+            return arg.to_func(cls, columns)
+
+        # arg == AbstractField -> item of the row
+        elif isinstance(arg, AbstractField):
+            if cls.base_fields.get(arg.name) is not arg:
+                raise FieldExpressionError(
+                    "'{}' is not a field of: {}".format(arg.name, cls.__name__))
+            pos = columns[arg.name]
+            return lambda row: row[pos]
+
+        # arg in self.context
+        elif not many and isinstance(arg, basestring) and arg in self.context:
+            arg = self.context[arg]
+
+        # arg == others -> constant(s), records are referenced by rowid
+        ref = lambda x: x.rowid if isinstance(x, BaseRecord) else x
+        val = [ref(x) for x in arg] if many else ref(arg)
+        return lambda row: val
+
+    def to_func(self, cls, columns):
+        """
+        Compile expression into a function evaluating it for a row (tuple)
+        of the record class 'cls', 'columns' maps the column names to their
+        position inside the row. Like in sql, a comparison (or arithmetic) 
+        involving None (NULL) results in None, i.e., is never true:
+
+        (Book.pages > 100) & (Book.isbn != "")
+          -> lambda row: row[2] > 100 and row[1] != ""
+        """
+        arg1 = self._prepare_func_arg(self.arg1, cls, columns)
+
+        # 'arg1' may be alone and without 'op'
+        if self.op is None:
+            return arg1
+
+        if self.op not in self.sql_operator_map:
+            raise FieldExpressionError("'{}' has no sql representation". \
+                    format(self.op.__name__))
+
+        op = self.func_operator_map.get(self.op, self.op)
+        if self.op in self.operator_one_arg:
+            return lambda row: op(arg1(row))
+
+        arg2 = self._prepare_func_arg(self.arg2, cls, columns,
+                many=(self.op is isin))
+        if self.op in self.null_operators:
+            return lambda row: self.null_safe(op, arg1(row), arg2(row))
+        return lambda row: op(arg1(row), arg2(row))
+
+    @staticmethod
+    def null_safe(op, a, b):
+        """(internal) apply 'op' to 'a' and 'b', None if one is None"""
+        if a is None or b is None:
+            return None
+        return op(a, b)
+
     # FieldExpressions may contain FieldExpressions 
     def __lt__(self, other):
         return FieldExpression(self, other, operator.lt)
@@ -185,5 +368,8 @@ class FieldExpression(object):
     def __div__(self, other):
         return FieldExpression(self, other, operator.div)
 
+    def isin(self, other):
+        return FieldExpression(self, other, isin)
+
 
 
@@ -7,7 +7,7 @@ import operator
 
 from core import DatabaseError
 from baserecord import BaseRecord 
-from field_expression import FieldExpression
+from field_expression import FieldExpression, isin, is_null, is_not_null
 
 __metaclass__ = type
 
@@ -37,8 +37,11 @@ class MetaClassKeywordHandler(type):
         cls.keywords = tmp_keys
             
         # create class-members with default val for each item in "cls.keywords"
+        # (a slot keeps the value per object, see SkeletonField.compact())
+        slots = dct.get("__slots__", ())
         for key, val in cls.keywords.items():
-            setattr(cls, key, val)
+            if not key in slots:
+                setattr(cls, key, val)
 
         super(MetaClassKeywordHandler, cls).__init__(name, bases, dct)
 
@@ -89,6 +92,34 @@ class MetaClassFieldGroup(MetaClassKeywordHandler):
         return out_inst
 
 
+def restore_compact(record, name):
+    """
+    (internal) returns a new compact field 'name' of the record class 
+    'record' to be unpickled, see CompactField.__reduce__()
+    """
+    for fname, field, compact in record.compact_fields():
+        if fname == name:
+            return field.spawn(compact, None)
+    raise DatabaseError("Cannot unpickle field '{}', not found in: {}". \
+            format(name, record.__name__))
+
+class CompactField(object):
+    """
+    Mixin for the compact field classes, see SkeletonField.compact(). These
+    are generated per record class and field, thus pickled as reference to 
+    both and the values of their slots.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        state = dict((k, getattr(self, k)) for k in self.compact_slots \
+                if not k in self.compact_transient and hasattr(self, k))
+        return (restore_compact, (self.parent.__class__, self.name), state)
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
 class SkeletonField(object):
     """Mostly just an interface for alle field incarnations."""
 
@@ -96,6 +127,15 @@ class SkeletonField(object):
 
     keywords = {}
 
+    # 'True' -> value was changed and needs to be saved
+    dirty = True
+
+    # the per object state of compact fields, see compact()
+    compact_slots = ("_value", "dirty", "parent")
+
+    # slots only caching data, these are not pickled
+    compact_transient = ()
+
     def clone(self, *vargs):
         """(internal) returns a clone (copy) of the Field-object (self)"""
         kw = {}
@@ -106,6 +146,35 @@ class SkeletonField(object):
                 kw[k] = v
         return self.__class__(*vargs, **kw)
 
+    def compact(self, name):
+        """
+        (internal) returns a class for compact copies of this (class) field 
+        named 'name'. Its metadata (keywords, ...) becomes class attributes 
+        shared by all copies, which only keep the 'compact_slots' per object.
+        The field classes do not define __slots__, so each copy could get a
+        __dict__, but it is never created, see spawn()
+        """
+        slots = self.compact_slots
+        out = type(self.__class__.__name__, (self.__class__, CompactField), 
+                {"__slots__": slots})
+        for k, v in self.__dict__.items():
+            if not k in slots:
+                setattr(out, k, v)
+        out.name = name
+        return out
+
+    def spawn(self, compact, parent, dirty=False):
+        """
+        (internal) returns a fast copy of this (class) field for the record 
+        object 'parent' as instance of 'compact', see compact(). Skips the 
+        keyword handling done by clone()
+        """
+        out = compact.__new__(compact)
+        out._value = self._value
+        out.parent = parent
+        out.dirty = dirty
+        return out
+
     def get_create(self, prefix=None, suffix=None):
         """Returning None, means: no column in table for this field"""
         return None 
@@ -126,10 +195,19 @@ class SkeletonField(object):
         """
         return True 
     
-    def set(self, v):
-        """Set field value to 'v'"""
+    def mark_dirty(self):
+        """Flag this field and its parent record as changed"""
+        self.dirty = True
         if self.parent is not None:
             self.parent.dirty = True
+
+    def set(self, v):
+        """Set field value to 'v'"""
+        self.mark_dirty()
+        self._value = v
+
+    def load(self, v):
+        """(internal) set value 'v' as loaded from the database (clean)"""
         self._value = v
 
     def get(self):
@@ -194,6 +272,16 @@ class SkeletonField(object):
     def __div__(self, other):
         return FieldExpression(self, other, operator.div)
 
+    # operations without a python operator
+    def isin(self, other):
+        return FieldExpression(self, other, isin)
+
+    def is_null(self):
+        return FieldExpression(self, None, is_null)
+
+    def is_not_null(self):
+        return FieldExpression(self, None, is_not_null)
+
 
 class BaseFieldGroup(SkeletonField):
     """
@@ -218,6 +306,11 @@ class BaseFieldGroup(SkeletonField):
         args = BaseFieldGroup.cls_ctor_args if ctor_args is None else ctor_args
         self._value = self.cls(*args) if args else self.cls()
 
+    def spawn(self, compact, parent, dirty=False):
+        out = super(BaseFieldGroup, self).spawn(compact, parent, dirty)
+        out._value = self.cls()
+        return out
+
     def update_cls(self, ctor_args=None, from_fields=True):
         """construct instance of 'cls'"""
         obj = self._value 
@@ -263,6 +356,7 @@ class AbstractField(SkeletonField):
      'primary_key' -> (the only!) primary_key in the parent's table 
      'unique'      -> no duplicate entries inside one table for this field
      'auto_inc'    -> automatically increment field value on each insert 
+     'index'       -> create an index on this column (see core.Index)
     """
     
     __metaclass__ = MetaClassKeywordHandler
@@ -270,7 +364,7 @@ class AbstractField(SkeletonField):
     # various field flags, and special default values
     keywords = {"name":        None,  "size":     None,  "default": None,
                 "primary_key": False, "required": False, "unique": False,
-                "auto_inc":    False, "parent":   None}
+                "auto_inc":    False, "parent":   None,  "index":   False}
 
     def __init__(self, **kw):
         # keeps the explicit value of this field (and it's object, if applicable)
@@ -346,6 +440,10 @@ class BooleanField(IntegerField):
 
     def set(self, val):
         assert val in [True, False, 0, 1]
+        self.mark_dirty()
+        self._value = val in [True, 1]
+
+    def load(self, val):
         self._value = val in [True, 1]
 
     def get_escaped(self, default=False):
@@ -420,7 +518,10 @@ class StringField(AbstractField):
         if self._value is None:
             return not self.required
 
-        self.set(self._value.strip())
+        # only touch (i.e., dirty) the field, if stripping changes anything
+        stripped = self._value.strip()
+        if stripped != self._value:
+            self.set(stripped)
         return True
 
 class OptionField(StringField):
@@ -458,6 +559,7 @@ class OptionField(StringField):
 
     def set(self, val):
         assert val in self.options
+        self.mark_dirty()
         self._value = val
         
 # Mixin-class to make a Field only "virtual", without a representing "real" column
@@ -472,6 +574,10 @@ class NoneTableField(AbstractField):
 class AbstractRelationField(AbstractField):
     keywords = {"rel_record": None,        "backref": None, 
                 "idtype": (int, long),     "expr": None}
+
+    compact_slots = AbstractField.compact_slots + \
+            ("obj_store", "rel_obj", "rel_objs")
+    compact_transient = ("rel_obj", "rel_objs")
     
     def __init__(self, rel_record, **kw):
         assert issubclass(rel_record, BaseRecord)
@@ -481,32 +587,67 @@ class AbstractRelationField(AbstractField):
         # slot to keep assigned, not-saved relation object(s)
         self.obj_store = []
 
+        # already loaded (or assigned) related object, see: get_related()
+        self.rel_obj = None
+
+        # already loaded related objects (1:n), see OneToManyRelation.get()
+        self.rel_objs = None
+
         super(AbstractRelationField, self).__init__(**kw)
     
     def get(self):
         raise NotImplementedError()
 
+    def spawn(self, compact, parent, dirty=False):
+        out = super(AbstractRelationField, self).spawn(compact, parent, dirty)
+        out.obj_store = []
+        out.rel_obj = None
+        out.rel_objs = None
+        return out
+
     def set(self, val):
+        self.mark_dirty()
+
         # target/right field type
- 
         if isinstance(val, self.rel_record):
             # not saved yet, keep obj
             if val.rowid is None:
                 self.obj_store.append(val)
-            # saved, keep 'rowid'
+                return
+            # saved, keep 'rowid' (and the object itself)
             else:
                 self._value = val.rowid
+                self.rel_obj = val
 
         # trust any valid numeric
         elif isinstance(val, self.idtype):
             self._value = val 
 
+        # no related object (e.g., NULL column)
+        elif val is None:
+            self._value = None
+
         else:
             raise TypeError(
                 "Passed wrong value to {}. instead of id ({}) or {}, I got {}".
-                format([str(x) for x in numtypes], 
-                       record.__class__.__name__, 
+                format(self.name, ", ".join(x.__name__ for x in self.idtype), 
+                       self.rel_record.__name__, 
                        str(type(val))))        
+
+        # a later assignment replaces the not-saved object
+        del self.obj_store[:]
+
+    def pending(self):
+        """Return the assigned object, which is not saved yet, or None"""
+        if self.obj_store and self.obj_store[-1].rowid is None:
+            return self.obj_store[-1]
+        return None
+
+    def pre_save(self, action="insert", obj=None):
+        # the assigned object was saved meanwhile, reference its rowid
+        if self.obj_store and self.obj_store[-1].rowid is not None:
+            self.set(self.obj_store[-1])
+        return super(AbstractRelationField, self).pre_save(action, obj)
    
     def setup_relation(self, record):
         """Do the necassary housekeeping for this relation class/field"""
@@ -515,11 +656,25 @@ class AbstractRelationField(AbstractField):
     def gen_backref_name(self, target):
         """Generate an unique back-reference identifier"""
         return target.__name__.lower()
+
+    def get_related(self):
+        """
+        Return the referenced 'rel_record' object, without a query, if it was
+        already loaded (e.g., using select_related()) or assigned
+        """
+        obj = self.rel_obj
+        if obj is not None and obj.rowid == self._value:
+            return obj
+        return self.rel_record.objects.get(rowid=self._value)
    
 # column in 'rel_record' pointing at my parent 
 # this field MUST always generate a backref ...
 class OneToManyRelation(AbstractRelationField, NoneTableField):
     def get(self):
+        # already loaded using prefetch_related()
+        if self.rel_objs is not None:
+            return self.rel_objs
+
         q = {self.backref: self.parent}
         return self.rel_record.objects.filter(**q)
 
@@ -533,7 +688,11 @@ class OneToManyRelation(AbstractRelationField, NoneTableField):
 # column in 'my parent' record, each entry references ONE 'rel_record'
 class ManyToOneRelation(AbstractRelationField, IntegerField):
     def get(self):
-        return self.rel_record.objects.get(rowid=self._value)
+        return self.get_related()
+
+    def get_save(self):
+        # the column keeps the related 'rowid', no need to load the object
+        return self._value or None
 
     def setup_relation(self, record):
         if self.backref is not None:
@@ -553,7 +712,11 @@ class OneToOneBackrefRelation(AbstractRelationField, NoneTableField):
 # simple 1-to-1 relation, the target record gets a OneToOneBackrefRelation (without a column!)
 class OneToOneRelation(AbstractRelationField, IntegerField):
     def get(self):
-        return self.rel_record.objects.get(rowid=self._value)
+        return self.get_related()
+
+    def get_save(self):
+        # the column keeps the related 'rowid', no need to load the object
+        return self._value or None
 
     def setup_relation(self, record):
         if self.backref is not None:
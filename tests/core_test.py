@@ -0,0 +1,1266 @@
+import os, sys
+import time 
+import unittest 
+import tempfile
+import shutil
+import threading
+import gc
+import pickle
+
+sys.path.append("..")
+
+from baserecord import BaseRecord
+from fields import StringField, IntegerField, DateTimeField, \
+        FloatField, ManyToOneRelation, OneToOneRelation, BooleanField, \
+        BaseFieldGroup
+from core import SQLiteDatabase, DatabaseError, SQLiteDatabaseError, \
+        MemoryDatabase, MemoryDatabaseError, MemoryTable, IntegrityError, \
+        Index, Count, Sum, Avg, Min, Max
+from field_expression import FieldExpressionError
+from executor import Executor, ExecutorError, CancelledError
+
+class Point(object):
+    def __init__(self, x=None, y=None):
+        self.x = x
+        self.y = y
+
+class PointFieldGroup(BaseFieldGroup):
+    cls = Point
+    cls_ctor_args = ()
+    key2field = {"x": FloatField(), "y": FloatField()}
+
+
+class CoreTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        db_name = ":memory:"
+        self.db = SQLiteDatabase()
+        self.db.setup(db_name, full=False)
+    
+    def tearDown(self):
+        self.db.reset()
+        self.db.close()
+
+    def test_bulk_create(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+            word = StringField(size=40)
+            created = DateTimeField(auto_now_add=True)
+
+        self.db.create_tables()
+        
+        objs = [MyModel(num=i, word=" w{} ".format(i)) for i in xrange(50)]
+        counter = MyModel.database.query_counter
+        MyModel.objects.bulk_create(objs, batch_size=20)
+        
+        # 50 rows -> 3 chunks -> 3 queries
+        self.assertTrue(MyModel.database.query_counter - counter == 3)
+        self.assertTrue(all(o.rowid is not None for o in objs))
+        self.assertTrue(all(o.created > 0 for o in objs))
+        
+        for o in objs:
+            m = MyModel.objects.get(rowid=o.rowid)
+            self.assertTrue(m.num == o.num)
+            self.assertTrue(m.word == o.word.strip())
+
+    def test_bulk_create_saved_obj(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+
+        self.db.create_tables()
+        m = MyModel(num=1)
+        m.save()
+        self.assertRaises(DatabaseError, 
+                MyModel.objects.bulk_create, [m, MyModel(num=2)])
+
+    def test_bulk_create_failing_chunk(self):
+        class MyModel(BaseRecord):
+            num = IntegerField(unique=True)
+
+        self.db.create_tables()
+        MyModel(num=5).save()
+        
+        # the second chunk fails, the first one is rolled back as well
+        objs = [MyModel(num=i) for i in (1, 2, 3, 5)]
+        self.assertRaises(Exception, MyModel.objects.bulk_create, objs, 
+                batch_size=2)
+        self.assertTrue(all(o.rowid is None and o.dirty for o in objs))
+        self.assertTrue(MyModel.objects.count() == 1)
+
+        objs[-1].num = 4
+        MyModel.objects.bulk_create(objs, batch_size=2)
+        self.assertTrue(MyModel.objects.count() == 5)
+
+    def test_atomic(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+
+        self.db.create_tables()
+        with self.db.atomic():
+            MyModel(num=1).save()
+            MyModel(num=2).save()
+        self.assertTrue(len(MyModel.objects.all()) == 2)
+        
+        try:
+            with self.db.atomic():
+                MyModel(num=3).save()
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertTrue(len(MyModel.objects.all()) == 2)
+
+    def test_atomic_nested(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+
+        self.db.create_tables()
+        with self.db.transaction():
+            MyModel(num=1).save()
+            try:
+                with self.db.atomic():
+                    MyModel(num=2).save()
+                    raise ValueError()
+            except ValueError:
+                pass
+            MyModel(num=3).save()
+        
+        self.assertTrue(sorted(m.num for m in MyModel.objects.all()) == [1, 3])
+
+    def test_keyset_iterator(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+            word = StringField(size=40)
+
+        self.db.create_tables()
+        MyModel.objects.bulk_create(MyModel(num=i % 7, word=str(i)) \
+                for i in xrange(100))
+        
+        rows = list(MyModel.objects.iterator(prefetch_rows=9))
+        self.assertTrue([m.rowid for m in rows] == range(1, 101))
+        
+        rows = list(MyModel.objects.iterator(prefetch_rows=9, limit=(5, 20)))
+        self.assertTrue([m.rowid for m in rows] == range(6, 26))
+
+        # non-unique order is made unique using the rowid
+        MyModel.objects.order_by = ("-num", "word")
+        rows = list(MyModel.objects.iterator(prefetch_rows=4))
+        ref = sorted(MyModel.objects.all(), key=lambda m: (-m.num, m.word))
+        MyModel.objects.order_by = None
+        self.assertTrue([m.rowid for m in rows] == [m.rowid for m in ref])
+
+    def test_keyset_iterator_null(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+            score = IntegerField(default=None)
+
+        self.db.create_tables()
+        MyModel.objects.bulk_create(MyModel(num=i, 
+            score=(i if i % 2 else None)) for i in xrange(10))
+        
+        # a NULL key can not be seeked behind, all rows are returned anyway
+        for order in (("score",), ("-score",), ("score", "-num")):
+            MyModel.objects.order_by = order
+            rows = list(MyModel.objects.iterator(prefetch_rows=3))
+            ref = list(MyModel.objects.all())
+            MyModel.objects.order_by = None
+            self.assertTrue(sorted(m.rowid for m in rows) == range(1, 11))
+            self.assertTrue([(m.score, m.num) for m in rows] == \
+                    [(m.score, m.num) for m in ref])
+
+    def test_stream(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+
+        self.db.create_tables()
+        MyModel.objects.bulk_create(MyModel(num=i % 3) for i in xrange(30))
+        
+        it = MyModel.objects.stream(chunk_size=4, num=1)
+        self.assertFalse(isinstance(it, list))
+        
+        # other queries are possible while the stream is still open
+        first = next(it)
+        self.assertTrue(len(MyModel.objects.all()) == 30)
+        rest = list(it)
+        
+        self.assertTrue(len(rest) == 9)
+        self.assertTrue(all(m.num == 1 for m in [first] + rest))
+
+    def test_thread_connections(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+
+        # in-memory databases are not shared between connections, use a file
+        self.db.close()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.db.setup(os.path.join(tmp_dir, "test.sqlite"), full=False)
+            self.db.create_tables()
+            
+            mode = self.db.connect().con.execute(
+                    "PRAGMA journal_mode").fetchone()[0]
+            self.assertTrue(mode == "wal")
+
+            # the results are checked here, failures inside a thread are lost
+            cons, nums = [], {}
+            def work(offset):
+                cons.append(self.db.connect().con)
+                for i in xrange(20):
+                    with self.db.atomic():
+                        m = MyModel(num=offset + i)
+                        m.save()
+                    nums[offset + i] = MyModel.objects.get(rowid=m.rowid).num
+
+            threads = [threading.Thread(target=work, args=(i * 100,)) \
+                    for i in xrange(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            
+            self.assertTrue(len(set(id(con) for con in cons)) == 4)
+            self.assertTrue(all(k == v for k, v in nums.items()) and \
+                    len(nums) == 80)
+            self.assertTrue(len(MyModel.objects.all()) == 80)
+
+            # connections of finished threads are not kept open
+            for i in xrange(30):
+                t = threading.Thread(target=lambda: MyModel.objects.count())
+                t.start()
+                t.join()
+            self.assertTrue(len(self.db.pool.connections) <= 2)
+        finally:
+            self.db.close()
+            shutil.rmtree(tmp_dir)
+
+    def test_stmt_cache(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+
+        class OtherModel(BaseRecord):
+            ref = ManyToOneRelation(MyModel, backref="others")
+
+        self.db.create_tables()
+        m = MyModel(num=1)
+        m.save()
+        m.num = 2
+        m.save()
+        self.assertTrue(MyModel.objects.get(num=2).rowid == m.rowid)
+        self.assertTrue(len(MyModel.stmt_cache) > 0)
+        
+        # adding a field (here: a backref) invalidates the cache
+        self.db.setup_relations()
+        self.assertTrue(len(MyModel.stmt_cache) == 0)
+        self.assertTrue("others" in self.db.field_names(MyModel))
+
+    def test_dirty_fields(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+            word = StringField(size=40)
+
+        self.db.create_tables()
+        MyModel(num=1, word="foo").save()
+        
+        m = MyModel.objects.get(num=1)
+        self.assertFalse(m.dirty)
+        
+        # clean object -> no query at all
+        counter = MyModel.database.query_counter
+        m.save()
+        self.assertTrue(MyModel.database.query_counter == counter)
+
+        # only the changed column is written
+        self.db.query("UPDATE mymodel SET word=? WHERE rowid=?", 
+                ("bar", m.rowid))
+        m.num = 2
+        self.assertTrue(m.dirty)
+        m.save()
+        self.assertFalse(m.dirty)
+        
+        m = MyModel.objects.get(rowid=m.rowid)
+        self.assertTrue(m.num == 2 and m.word == "bar")
+
+    def test_identity_map(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a = Author(name="foo")
+        a.save()
+        Book.objects.bulk_create(Book(title=str(i), author=a) \
+                for i in xrange(5))
+
+        # outside a session each access loads a new object
+        b = Book.objects.all()[0]
+        self.assertFalse(b.author is b.author)
+        
+        with self.db.session(size=3) as imap:
+            books = list(Book.objects.all())
+            counter = Author.database.query_counter
+            authors = [b.author for b in books]
+            self.assertTrue(Author.database.query_counter - counter == 1)
+            self.assertTrue(all(x is authors[0] for x in authors))
+            self.assertTrue(Book.objects.get(rowid=books[-1].rowid) \
+                    is books[-1])
+            
+            stats = imap.stats()
+            self.assertTrue(stats["used"] == 3)
+            self.assertTrue(stats["evictions"] == 3)
+            self.assertTrue(stats["hits"] >= 5)
+
+        self.assertTrue(self.db.identity_map() is None)
+
+    def test_select_related(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            name = StringField(size=40)
+            author = ManyToOneRelation(Author, backref="books")
+            editor = OneToOneRelation(Author)
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a1, a2 = Author(name="a1"), Author(name="a2")
+        a1.save()
+        a2.save()
+        Book(name="b1", author=a1, editor=a2).save()
+        Book(name="b2", author=a2).save()
+
+        books = list(Book.objects.all().select_related("author", "editor"). \
+                order_by("name"))
+        
+        counter = Author.database.query_counter
+        self.assertTrue([b.author.name for b in books] == ["a1", "a2"])
+        self.assertTrue(books[0].editor.name == "a2")
+        self.assertTrue(books[0].name == "b1")
+        self.assertTrue(Author.database.query_counter == counter)
+        
+        # no referenced row
+        self.assertTrue(books[1].editor is None)
+        
+        self.assertRaises(DatabaseError, 
+                list, Book.objects.select_related("name").all())
+
+    def test_prefetch_related(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            name = StringField(size=40)
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        authors = Author.objects.bulk_create(Author(name=str(i)) \
+                for i in xrange(10))
+        Book.objects.bulk_create(Book(name=str(i), author=authors[i % 7]) \
+                for i in xrange(30))
+
+        counter = Book.database.query_counter
+        authors = list(Author.objects.prefetch_related("books").all())
+        self.assertTrue(Book.database.query_counter - counter == 2)
+        
+        counter = Book.database.query_counter
+        self.assertTrue(sum(len(a.books) for a in authors) == 30)
+        self.assertTrue(Book.database.query_counter == counter)
+        self.assertTrue(len(authors[0].books) == 5)
+        self.assertTrue(len(authors[9].books) == 0)
+        
+        # chunked 
+        rows = list(Author.objects.prefetch_related("books"). \
+                iterator(prefetch_rows=3))
+        self.assertTrue([len(a.books) for a in rows] == \
+                [len(a.books) for a in authors])
+
+        # streamed, prefetched per chunk
+        for it in (Author.objects.prefetch_related("books").stream(
+                    chunk_size=4), Author.objects.prefetch_related("books"). \
+                    all().iterator(chunk_size=4)):
+            rows = list(it)
+            counter = Book.database.query_counter
+            self.assertTrue(sorted(len(a.books) for a in rows) == \
+                    sorted(len(a.books) for a in authors))
+            self.assertTrue(Book.database.query_counter == counter)
+
+    def test_query_set(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+            word = StringField(size=40)
+
+        self.db.create_tables()
+        MyModel.objects.bulk_create(MyModel(num=i, word=str(i % 2)) \
+                for i in xrange(20))
+        
+        # composing does not query
+        counter = MyModel.database.query_counter
+        qs = MyModel.objects.filter(word="1").exclude(num=3).order_by("-num")
+        sub = qs[2:5]
+        self.assertTrue(MyModel.database.query_counter == counter)
+        
+        self.assertTrue(len(qs) == 9)
+        self.assertTrue(qs.count() == 9 and qs.exists())
+        self.assertFalse(MyModel.objects.filter(num=100).exists())
+        self.assertTrue([m.num for m in sub] == [15, 13, 11])
+        self.assertTrue(sub.count() == 3)
+        self.assertTrue([m.num for m in sub[1:]] == [13, 11])
+        self.assertTrue(qs[0].num == 19)
+        self.assertTrue(MyModel.database.query_counter - counter == 6)
+        
+        # fetched once, then cached
+        self.assertTrue([m.num for m in qs][-2:] == [5, 1])
+        counter = MyModel.database.query_counter
+        self.assertTrue(len(qs) == 9 and qs[-1].num == 1)
+        self.assertTrue(MyModel.database.query_counter == counter)
+
+        self.assertRaises(IndexError, lambda: MyModel.objects.all()[20])
+        self.assertTrue(MyModel.objects.get(num=4).word == "0")
+
+    def test_expression_filter(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            num = IntegerField()
+            isbn = StringField(size=40)
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a = Author(name="foo")
+        a.save()
+        Book.objects.bulk_create(Book(num=i, isbn=str(i) if i % 3 else "", 
+            author=a if i < 5 else None) for i in xrange(10))
+        
+        nums = lambda qs: sorted(b.num for b in qs)
+        self.assertTrue(nums(Book.objects.filter(
+                (Book.num > 4) & (Book.isbn != ""))) == [5, 7, 8])
+        self.assertTrue(nums(Book.objects.filter(
+                (Book.num < 2) | ~(Book.num <= 8))) == [0, 1, 9])
+        self.assertTrue(nums(Book.objects.filter(
+                Book.num * 2 + 1 == 7)) == [3])
+        self.assertTrue(nums(Book.objects.filter(
+                Book.num.isin([1, 2, 3, 99]))) == [1, 2, 3])
+        self.assertTrue(nums(Book.objects.filter(
+                Book.author.is_null())) == range(5, 10))
+        self.assertTrue(nums(Book.objects.filter(Book.author == a, 
+                num=2)) == [2])
+        self.assertTrue(nums(Book.objects.exclude(Book.num > 1, 
+                isbn="")) == [0, 1, 2, 4, 5, 7, 8])
+        
+        sql, vals = ((Book.num > 4) & (Book.isbn != "")).to_sql(Book)
+        self.assertTrue(sql == "(book.num > ?) AND (book.isbn <> ?)")
+        self.assertTrue(vals == [4, ""])
+
+        self.assertRaises(FieldExpressionError, \
+                lambda: list(Book.objects.filter(
+                Author.name == "foo")))
+
+    def test_aggregate(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            num = IntegerField()
+            isbn = StringField(size=40)
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a1, a2 = Author(name="a1"), Author(name="a2")
+        a1.save()
+        a2.save()
+        Book.objects.bulk_create(Book(num=i, isbn=str(i % 3), 
+            author=a1 if i < 6 else a2) for i in xrange(10))
+        
+        counter = Book.database.query_counter
+        res = Book.objects.aggregate(n=Count(), total=Sum("num"), 
+                avg=Avg("num"), low=Min("num"), high=Max("num"), 
+                isbns=Count("isbn", distinct=True))
+        self.assertTrue(res == {"n": 10, "total": 45, "avg": 4.5, "low": 0, 
+            "high": 9, "isbns": 3})
+        self.assertTrue(Book.database.query_counter == counter + 1)
+        
+        self.assertTrue(Book.objects.filter(Book.num > 6).aggregate(
+            total=Sum("num")) == {"total": 24})
+        self.assertTrue(Book.objects.all().order_by("-num")[:3].aggregate(
+            total=Sum("num")) == {"total": 24})
+        
+        res = Book.objects.group_by("author").order_by("-n").annotate(
+                n=Count(), high=Max("num"))
+        self.assertTrue(res == [{"author": a1.rowid, "n": 6, "high": 5}, 
+            {"author": a2.rowid, "n": 4, "high": 9}])
+        res = Book.objects.filter(Book.num < 8).group_by("author", 
+                "isbn").order_by("author", "isbn")[:2].annotate(n=Count())
+        self.assertTrue([(x["isbn"], x["n"]) for x in res] == \
+                [("0", 2), ("1", 2)])
+
+        self.assertRaises(SQLiteDatabaseError, 
+                lambda: Book.objects.aggregate(total=Sum("isbn")))
+        self.assertRaises(SQLiteDatabaseError, 
+                lambda: Book.objects.aggregate(total=Sum("foo")))
+        self.assertRaises(SQLiteDatabaseError, 
+                lambda: Book.objects.group_by("books").annotate(n=Count()))
+
+    def test_indexes(self):
+        class Author(BaseRecord):
+            name = StringField(size=40, index=True)
+            email = StringField(size=40, unique=True, index=True)
+
+        class Book(BaseRecord):
+            num = IntegerField()
+            isbn = StringField(size=40)
+            author = ManyToOneRelation(Author, backref="books")
+            editor = OneToOneRelation(Author)
+            sub = IntegerField()
+            title = StringField(size=40)
+            sub_title = StringField(size=40)
+
+            indexes = [Index("author", "-num"), 
+                    Index("isbn", unique=True, where="isbn <> ''"),
+                    Index("sub", "title"), Index("sub_title")]
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        # indexes are created only once
+        self.db.create_tables()
+
+        rows = self.db.query("SELECT name, tbl_name, sql FROM sqlite_master" \
+                " WHERE type='index' AND sql IS NOT NULL")
+        idx = dict((row[0], row[2]) for row in rows)
+        # 'author' leads a declared index, so it needs no own one
+        self.assertTrue(sorted(idx) == ["idx_author_name", 
+            "idx_book_author_num", "idx_book_editor", "idx_book_sub__title",
+            "idx_book_sub_title", "uidx_book_isbn"])
+        self.assertTrue(idx["idx_book_sub__title"].endswith(
+            "ON book (sub_title)"))
+        self.assertTrue(idx["idx_book_author_num"].endswith(
+            "ON book (author, num DESC)"))
+        self.assertTrue(idx["uidx_book_isbn"].endswith("WHERE isbn <> ''"))
+
+        # backref lookups use the relation column index
+        plan = self.db.connect().con.execute("EXPLAIN QUERY PLAN SELECT " \
+                "rowid, * FROM book WHERE book.editor=?", [1]).fetchall()
+        self.assertTrue("idx_book_editor" in plan[0][-1])
+
+        # partial unique index: empty isbns may repeat
+        a = Author(name="a", email="a@b")
+        a.save()
+        Book.objects.bulk_create([Book(isbn="", author=a), Book(isbn=""), 
+            Book(isbn="1")])
+        self.assertRaises(IntegrityError, lambda: Book(isbn="1").save())
+        
+        self.assertRaises(DatabaseError, lambda: Index("num", foo=1))
+        self.assertRaises(SQLiteDatabaseError, 
+                lambda: Index("foo").get_create(self.db, Book))
+
+    def test_row_loader(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            num = IntegerField()
+            avail = BooleanField()
+            pos = PointFieldGroup()
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a = Author(name="foo")
+        a.save()
+        Book(title="t", num=3, avail=True, pos=Point(1.0, 2.0), 
+                author=a).save()
+        
+        row = self.db.query("SELECT rowid, * FROM book")[0]
+        b1 = self.db.row_loader(Book)(row)
+        b2 = Book(**row)
+        self.assertTrue(self.db.row_loader(Book) is \
+                self.db.row_loader(Book))
+        
+        self.assertTrue(sorted(x for x in b1 if x[0] != "pos") == \
+                sorted(x for x in b2 if x[0] != "pos"))
+        self.assertTrue(not b1.dirty and not b1.fields["num"].dirty)
+        self.assertTrue(b1.avail is True and b1.pos.y == 2.0)
+        self.assertTrue(b1.author.name == "foo" and len(a.books) == 1)
+        
+        # each loaded object keeps its own field (and group) objects
+        b3 = self.db.row_loader(Book)(row)
+        b3.num = 4
+        b3.pos.x = 5.0
+        self.assertTrue(b1.num == 3 and b1.pos.x == 1.0)
+        self.assertTrue(b3.dirty and not b1.dirty)
+        b3.save()
+        self.assertTrue(Book.objects.get(rowid=b1.rowid).num == 4)
+
+    def test_compact_fields(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            title = StringField(size=80, required=True)
+            pos = PointFieldGroup()
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a = Author(name="foo")
+        a.save()
+        Book(title="t1", author=a, pos=Point(1.0, 2.0)).save()
+        Book(title="t2").save()
+
+        b1, b2 = Book.objects.all().order_by("title")
+        f1, f2 = b1.fields["title"], b2.fields["title"]
+        
+        # the metadata is shared, only value, dirty-flag, parent are kept 
+        self.assertTrue(f1.__class__ is f2.__class__ and \
+                isinstance(f1, StringField))
+        self.assertTrue(f1.size == 80 and f1.required and f1.name == "title")
+        self.assertTrue(f1.get() == "t1" and f1.parent is b1)
+        # no __dict__ is created for the compact fields
+        for field in b1.fields.values():
+            self.assertFalse(any(type(x) is dict \
+                    for x in gc.get_referents(field)))
+        
+        b3 = Book(title="t3", author=a)
+        self.assertTrue(b3.fields["title"].__class__ is f1.__class__)
+        self.assertTrue(b3.fields["pos"].name == "pos")
+        self.assertTrue(b1.pos is not b2.pos and b1.pos.y == 2.0)
+        self.assertTrue(b1.author.name == "foo" and b2.author is None)
+
+        # pickle finds the record classes by name, the fields by record
+        globals().update(Author=Author, Book=Book)
+        try:
+            for proto in (0, 2):
+                b = pickle.loads(pickle.dumps(b1, proto))
+                self.assertTrue(b.rowid == b1.rowid and b.title == "t1")
+                self.assertTrue(b.fields["title"].__class__ is f1.__class__)
+                self.assertTrue(b.fields["title"].parent is b and not b.dirty)
+                self.assertTrue(b.pos.y == 2.0 and b.author.name == "foo")
+                b.title = "t4"
+                self.assertTrue(b.dirty and b1.title == "t1")
+            
+            b = Book.objects.lazy().get(title="t2")
+            self.assertTrue(pickle.loads(pickle.dumps(b, 2)).title == "t2")
+        finally:
+            del globals()["Author"], globals()["Book"]
+
+    def test_lazy_fields(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            num = IntegerField()
+            pos = PointFieldGroup()
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a = Author(name="foo")
+        a.save()
+        Book.objects.bulk_create([Book(title="t1", num=1, 
+            pos=Point(1.0, 2.0), author=a), Book(title="t2", num=2)])
+
+        b1, b2 = Book.objects.lazy().all().order_by("num")
+        self.assertTrue(b1.fields.loaded() == [])
+        self.assertTrue(b1.num == 1 and not b1.dirty)
+        self.assertTrue([k for k, v in b1.fields.loaded()] == ["num"])
+
+        # a group constructs its fields
+        self.assertTrue(b1.pos.y == 2.0 and "pos__x" in dict(
+            b1.fields.loaded()))
+        self.assertTrue(b1.author.name == "foo")
+        
+        # only changed fields are saved
+        b1.title = "t3"
+        b1.save()
+        self.assertTrue(Book.objects.get(title="t3").num == 1)
+        
+        # iterating over all fields constructs them
+        self.assertTrue(len(b2.fields.loaded()) == 0)
+        self.assertTrue(dict(b2)["title"] == "t2" and b2.fields.row is None)
+        self.assertTrue(len(b2.fields.loaded()) == len(Book.base_fields))
+        self.assertTrue(b2.pos.x == 0.0)
+        self.assertTrue([b.num for b in Book.objects.lazy().stream()] == \
+                [1, 2])
+
+    def test_only_defer(self):
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            abstract = StringField(size=1000)
+            num = IntegerField()
+            pos = PointFieldGroup()
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        Book.objects.bulk_create(Book(title=str(i), abstract="a" * i, num=i,
+            pos=Point(i, i)) for i in xrange(10))
+
+        books = Book.objects.only("title", "pos").all().order_by("num")
+        q, vals = self.db.select_query(Book, "=", None, None, None, None, 
+                None, {}, deferred=books.manager.deferred)
+        self.assertTrue(not "abstract" in q and "book.pos__x AS pos__x" in q)
+        
+        counter = Book.database.query_counter
+        books = list(books)
+        self.assertTrue([b.title for b in books] == map(str, range(10)))
+        self.assertTrue(books[3].pos.x == 3.0)
+        self.assertTrue(Book.database.query_counter == counter + 1)
+        
+        # all deferred columns are loaded at once
+        self.assertTrue(books[2].abstract == "aa")
+        self.assertTrue([b.num for b in books] == range(10))
+        self.assertTrue(Book.database.query_counter == counter + 2)
+
+        b = Book.objects.defer("abstract").get(num=4)
+        b.title = "x"
+        b.save()
+        b = Book.objects.get(num=4)
+        self.assertTrue(b.title == "x" and b.abstract == "aaaa")
+
+        # saving changed titles does not load the deferred columns
+        books = list(Book.objects.only("title").all().order_by("num"))
+        counter = Book.database.query_counter
+        books[5].title = "y"
+        books[5].save()
+        self.assertTrue(Book.database.query_counter == counter + 1)
+        self.assertTrue(all(b.fields.deferred is None for b in books))
+        self.assertTrue(Book.objects.get(num=5).title == "y")
+
+        nums = [b.num for b in Book.objects.defer("num").stream(chunk_size=3)]
+        self.assertTrue(sorted(nums) == range(10))
+        
+        self.assertRaises(DatabaseError, lambda: Book.objects.only("foo"))
+
+    def test_values(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            num = IntegerField()
+            pos = PointFieldGroup()
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a = Author(name="foo")
+        a.save()
+        Book.objects.bulk_create(Book(title=str(i), num=i, pos=Point(i, -i), 
+            author=a) for i in xrange(5))
+
+        vals = Book.objects.filter(Book.num > 2).order_by("-num").values(
+                "title", "pos", "author")
+        self.assertTrue(not isinstance(vals, list))
+        self.assertTrue(list(vals) == [
+            {"title": "4", "pos__x": 4.0, "pos__y": -4.0, "author": a.rowid},
+            {"title": "3", "pos__x": 3.0, "pos__y": -3.0, "author": a.rowid}])
+        
+        row = list(Book.objects.values())[0]
+        self.assertTrue(sorted(row) == ["author", "num", "pos__x", "pos__y", 
+            "rowid", "title"])
+        
+        self.assertTrue(list(Book.objects.all().order_by("num")[1:3]. \
+                values_list("num", "pos__y")) == [(1, -1.0), (2, -2.0)])
+        self.assertTrue(list(Book.objects.values_list("num", flat=True, 
+            chunk_size=2)) == range(5))
+        
+        self.assertRaises(DatabaseError, 
+                lambda: Book.objects.values_list("pos", flat=True))
+        self.assertRaises(DatabaseError, lambda: Book.objects.values("foo"))
+        self.assertRaises(TypeError, lambda: Book.objects.values(foo=1))
+
+    def test_to_numpy(self):
+        class Author(BaseRecord):
+            name = StringField(size=40)
+
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            num = IntegerField()
+            avail = BooleanField()
+            pos = PointFieldGroup()
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+        a = Author(name="foo")
+        a.save()
+        Book.objects.bulk_create(Book(title=str(i), num=i, avail=i % 2 == 0,
+            pos=Point(i, i * 0.5), author=a if i else None) \
+                    for i in xrange(7))
+        
+        try:
+            import numpy as np
+        except ImportError:
+            self.assertRaises(DatabaseError, lambda: Book.objects.to_numpy())
+            return
+
+        arrs = Book.objects.filter(Book.num > 0).order_by("num").to_numpy(
+                ["num", "avail", "pos", "author"], chunk_rows=4)
+        self.assertTrue(sorted(arrs) == ["author", "avail", "num", "pos__x", 
+            "pos__y"])
+        self.assertTrue(arrs["num"].dtype == np.int64 and \
+                arrs["num"].tolist() == range(1, 7))
+        self.assertTrue(arrs["avail"].dtype == np.bool_ and \
+                arrs["avail"].sum() == 3)
+        self.assertTrue(arrs["pos__y"].dtype == np.float64 and \
+                arrs["pos__y"][-1] == 3.0)
+
+        arr = Book.objects.all()[2:].to_numpy(["pos"], structured=True)
+        self.assertTrue(arr.dtype.names == ("pos__x", "pos__y") and \
+                arr["pos__x"].tolist() == [2.0, 3.0, 4.0, 5.0, 6.0])
+        self.assertTrue(sorted(Book.objects.filter(
+            Book.author.is_not_null()).to_numpy()) == ["author", 
+            "avail", "num", "pos__x", "pos__y", "rowid"])
+        
+        self.assertRaises(DatabaseError, 
+                lambda: Book.objects.to_numpy(["title"]))
+        self.assertRaises(DatabaseError, 
+                lambda: Book.objects.to_numpy(["author"]))
+
+        # NULL is NaN for floats, but never silently False or 0
+        self.db.query("UPDATE book SET avail=NULL, pos__x=NULL WHERE num=3")
+        self.assertRaises(DatabaseError,
+                lambda: Book.objects.to_numpy(["avail"]))
+        self.assertRaises(DatabaseError,
+                lambda: Book.objects.to_numpy(["num", "avail"],
+                    structured=True))
+        arr = Book.objects.all().order_by("num").to_numpy(
+                ["pos"])["pos__x"]
+        self.assertTrue(np.isnan(arr[3]) and arr[4] == 4.0)
+
+    def test_load_rows(self):
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            num = IntegerField()
+            pos = PointFieldGroup()
+
+        self.db.setup_relations()
+        self.db.create_tables()
+
+        counter = Book.database.query_counter
+        self.assertTrue(Book.objects.load_rows(((i, i * 0.5, str(i)) \
+            for i in xrange(5)), columns=["num", "pos__x", "title"], 
+                batch_size=2) == 5)
+        self.assertTrue(Book.database.query_counter == counter + 3)
+        self.assertTrue(Book.objects.get(num=3).pos.x == 1.5)
+        
+        # all columns in sorted order: num, pos__x, pos__y, title
+        Book.objects.load_rows([(5, 1.0, 2.0, "5")])
+        self.assertTrue(Book.objects.get(title="5").pos.y == 2.0)
+
+        xs = [0.5, 1.5, 2.5]
+        try:
+            import numpy as np
+            xs = np.array(xs)
+        except ImportError:
+            pass
+        self.assertTrue(Book.objects.load_columns({"pos__x": xs, 
+            "num": [10, 11, 12]}) == 3)
+        self.assertTrue(list(Book.objects.filter(Book.num >= 10). \
+                values_list("pos__x", flat=True)) == [0.5, 1.5, 2.5])
+        
+        # a failing batch rolls back the whole import
+        count = Book.objects.count()
+        self.assertRaises(SQLiteDatabaseError, lambda: Book.objects.load_rows(
+            [(1,), (2,), (3, 4)], columns=["num"], batch_size=2))
+        self.assertTrue(Book.objects.count() == count)
+        
+        self.assertRaises(SQLiteDatabaseError, 
+                lambda: Book.objects.load_rows([(1,)], columns=["pos"]))
+        self.assertRaises(DatabaseError, lambda: Book.objects.load_columns(
+            {"num": [1, 2], "title": ["a"]}))
+
+    def test_profiles(self):
+        class MyModel(BaseRecord):
+            num = IntegerField()
+
+        # the defaults are kept for in-memory databases (no journal file)
+        self.assertTrue(self.db.settings()["synchronous"] == 2)
+        
+        self.db.close()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.db.setup(os.path.join(tmp_dir, "test.sqlite"), full=False, 
+                    profile="balanced")
+            self.db.create_tables()
+            MyModel.objects.load_rows([(1,), (2,)])
+            
+            # each connection (thread) uses the profile
+            out = []
+            t = threading.Thread(target=lambda: out.append(self.db.settings()))
+            t.start()
+            t.join()
+            for settings in [self.db.settings()] + out:
+                self.assertTrue(settings["journal_mode"] == "wal")
+                self.assertTrue(settings["synchronous"] == 1)
+                self.assertTrue(settings["cache_size"] == -16000)
+                self.assertTrue(settings["mmap_size"] == 256 * 1024 ** 2)
+                self.assertTrue(settings["temp_store"] == 2)
+            self.db.close()
+
+            self.db.setup(os.path.join(tmp_dir, "test.sqlite"), full=False, 
+                    profile={"synchronous": "OFF", "cache_size": -4000})
+            settings = self.db.settings()
+            self.assertTrue(settings["synchronous"] == 0 and \
+                    settings["cache_size"] == -4000 and \
+                    settings["mmap_size"] == 0)
+            self.assertTrue(MyModel.objects.count() == 2)
+        finally:
+            self.db.close()
+            shutil.rmtree(tmp_dir)
+
+        self.assertRaises(DatabaseError, 
+                lambda: self.db.setup(":memory:", profile="fast"))
+        self.assertRaises(DatabaseError, 
+                lambda: self.db.setup(":memory:", profile={"foo": 1}))
+
+    def test_unit_of_work(self):
+        class Author(BaseRecord):
+            name = StringField(size=40, unique=True)
+
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            isbn = StringField(size=20, unique=True, default=None)
+            author = ManyToOneRelation(Author, backref="books")
+
+        self.db.setup_relations()
+        self.db.create_tables()
+
+        counter = Book.database.query_counter
+        with self.db.unit_of_work() as uow:
+            authors = [Author(name=str(i)) for i in xrange(3)]
+            for i in xrange(10):
+                Book.objects.store(Book(title="b{}".format(i), 
+                    author=authors[i % 3]))
+            self.assertTrue(len(uow) == 13)
+            self.assertTrue(Book.database.query_counter == counter)
+        
+        # the authors are inserted first, then the books: 2 queries
+        self.assertTrue(Book.database.query_counter == counter + 2)
+        self.assertTrue(all(a.rowid is not None for a in authors))
+        self.assertTrue(len(Author.objects.get(name="1").books) == 3)
+
+        # changed objects are updated, grouped by their changed columns
+        books = list(Book.objects.all())
+        counter = Book.database.query_counter
+        with self.db.unit_of_work(max_size=4):
+            for b in books:
+                b.title = b.title.upper()
+                Book.objects.store(b)
+            Book.objects.store(Book(title="new"))
+        self.assertTrue(Book.database.query_counter == counter + 4)
+        self.assertTrue(Book.objects.filter(title="B9").count() == 1)
+
+        # a failing flush leaves the objects unsaved
+        a = Author(name="x")
+        try:
+            with self.db.unit_of_work():
+                Book.objects.store(Book(title="c", author=a), Author(name="0"))
+        except Exception:
+            pass
+        self.assertTrue(a.rowid is None and a.dirty)
+        self.assertTrue(Author.objects.filter(name="x").count() == 0)
+
+        # updates done before a failing insert are rolled back as well
+        Book(title="dup", isbn="dup").save()
+        b = Book.objects.get(title="B1")
+        b.title = "changed"
+        try:
+            with self.db.unit_of_work():
+                Book.objects.store(b, Book(title="e", isbn="dup", 
+                    author=Author(name="y")))
+        except Exception:
+            pass
+        self.assertTrue(b.dirty)
+        self.assertTrue(Book.objects.filter(title="changed").count() == 0)
+        b.save()
+        self.assertTrue(Book.objects.filter(title="changed").count() == 1)
+
+        # a clean object is not kept, nor does it start the max_age timer
+        with self.db.unit_of_work(max_age=60) as uow:
+            Book.objects.store(b)
+            self.assertTrue(len(uow) == 0)
+            Book.objects.store(Book(title="f"))
+            self.assertTrue(len(uow) == 1)
+        with self.db.unit_of_work(max_age=0) as uow:
+            Book.objects.store(Book(title="g"))
+            self.assertTrue(len(uow) == 0)
+        self.assertTrue(Book.objects.filter(title="g").count() == 1)
+
+        # outside of a unit of work, the objects are saved immediately
+        Book.objects.store(Book(title="d", author=a))
+        self.assertTrue(Book.objects.get(title="d").author.name == "x")
+
+    def test_async(self):
+        class Book(BaseRecord):
+            title = StringField(size=40)
+            pages = IntegerField()
+
+        self.db.create_tables()
+        futures = [Book(title=str(i), pages=i).asave() for i in xrange(25)]
+        self.assertTrue(all(f.result(timeout=5) for f in futures))
+        
+        future = Book.objects.afilter(Book.pages >= 20)
+        self.assertTrue(sorted(b.pages for b in future.result(5)) == \
+                range(20, 25))
+        self.assertTrue(Book.objects.acount(pages=3).result(5) == 1)
+        self.assertTrue(Book.objects.aget(title="7").result(5).pages == 7)
+        self.assertTrue(Book.objects.filter(Book.pages < 10).order_by( \
+                "-pages")[:2].afetch().result(5)[1].pages == 8)
+        
+        # the workers run the jobs, the callbacks are called there, too 
+        out = []
+        future = self.db.submit(threading.current_thread)
+        future.add_done_callback(lambda f: out.append(f.result()))
+        self.assertTrue(future.result(5) is not threading.current_thread())
+        self.assertTrue(out == [future.result()])
+
+        # the next chunk is fetched while the current one is consumed
+        self.assertTrue([b.rowid for b in Book.objects.aiterator( \
+                prefetch_rows=4)] == range(1, 26))
+        
+        # jobs raising an exception
+        future = Book.objects.aget(pages__foo=1)
+        self.assertRaises(SQLiteDatabaseError, future.result, 5)
+
+        # backpressure and cancellation of pending jobs
+        executor = Executor(workers=1, max_pending=1, timeout=0.1)
+        event = threading.Event()
+        try:
+            running = executor.submit(event.wait, 5)
+            while not running.running():
+                time.sleep(0.01)
+            pending = executor.submit(lambda: 1)
+            self.assertRaises(ExecutorError, executor.submit, lambda: 2)
+            self.assertTrue(pending.cancel() and pending.cancelled())
+            self.assertRaises(CancelledError, pending.result)
+            self.assertFalse(running.cancel())
+            self.assertRaises(ExecutorError, running.result, 0.01)
+        finally:
+            event.set()
+            executor.shutdown()
+        self.assertTrue(running.result() is True)
+        self.assertRaises(ExecutorError, executor.submit, lambda: 3)
+
+        # a running job counts as cancelled, only if it is interrupted
+        def job(stop):
+            if stop.wait(5) and stop.abort:
+                raise ValueError()
+            return True
+        
+        executor = Executor(workers=1)
+        try:
+            for abort in (False, True):
+                stop = threading.Event()
+                stop.abort = abort
+                future = executor.submit(job, stop)
+                while not future.running():
+                    time.sleep(0.01)
+                future.interrupt = stop.set
+                self.assertTrue(future.cancel(5) == abort)
+                self.assertTrue(future.cancelled() == abort)
+        finally:
+            executor.shutdown()
+
+        # each accepted job is run, even if submitted during the shutdown
+        for i in xrange(20):
+            executor, futures = Executor(workers=2), []
+            def submit():
+                try:
+                    while True:
+                        futures.append(executor.submit(lambda: 1))
+                except ExecutorError:
+                    pass
+            t = threading.Thread(target=submit)
+            t.start()
+            executor.shutdown()
+            t.join()
+            self.assertTrue(all(f.result(5) == 1 for f in futures))
+
+    def test_memory_database(self):
+        db = MemoryDatabase()
+        
+        class Author(BaseRecord):
+            database = db
+            name = StringField(size=40, unique=True)
+
+        class Book(BaseRecord):
+            database = db
+            title = StringField(size=40)
+            pages = IntegerField()
+            author = ManyToOneRelation(Author, backref="books")
+        
+        try:
+            # the sqlite tables are not touched
+            self.assertFalse(Book in self.db.contributed_records)
+            db.setup_relations()
+            db.create_tables()
+            
+            authors = Author.objects.bulk_create(Author(name=str(i)) \
+                    for i in xrange(3))
+            Book.objects.bulk_create(Book(title="b{}".format(i), pages=i, 
+                author=authors[i % 3] if i < 9 else None) for i in xrange(12))
+            self.assertTrue(Book.objects.count() == 12)
+            self.assertTrue(sorted(Book.objects.filter(author=authors[1]). \
+                    values_list("pages", flat=True)) == [1, 4, 7])
+            self.assertTrue(len(authors[2].books) == 3)
+            self.assertTrue(Book.objects.get(title="b4").author.name == "1")
+            self.assertTrue([b.pages for b in Book.objects.filter(
+                (Book.pages > 2) & (Book.author == authors[0])). \
+                    order_by("-pages")] == [6, 3])
+            
+            # like in sql, NULL never compares (equal or not)
+            self.assertTrue(Book.objects.filter(Book.author.is_null()). \
+                    count() == 3)
+            self.assertTrue(Book.objects.exclude(author=authors[0]). \
+                    count() == 6)
+            self.assertTrue([b.pages for b in Book.objects.all()[2:5]] == \
+                    [2, 3, 4])
+
+            # a rowid is looked up without scanning the table
+            class NoScan(dict):
+                def keys(self):
+                    raise AssertionError("table scanned")
+            table = db.table(Book)
+            table.rows = NoScan(table.rows)
+            try:
+                self.assertTrue(Book.objects.get(rowid=3).title == "b2")
+                self.assertTrue(Book.objects.get(rowid=99) is None)
+            finally:
+                table.rows = dict(table.rows)
+
+            # the hash indexes follow updates and deletes
+            b = Book.objects.get(title="b1")
+            b.author = authors[2]
+            b.save()
+            self.assertTrue(len(Book.objects.filter(author=authors[2])) == 4)
+            b.destroy()
+            self.assertTrue(len(Book.objects.filter(author=authors[2])) == 3)
+            self.assertTrue(Book.objects.get(title="b1") is None)
+            self.assertRaises(IntegrityError, Author(name="1").save)
+
+            self.assertRaises(MemoryDatabaseError, 
+                    lambda: Book.objects.aggregate(n=Count()))
+
+            # a failing block is rolled back 
+            try:
+                with db.atomic():
+                    Book(title="x", pages=1).save()
+                    Author(name="0").save()
+            except IntegrityError:
+                pass
+            self.assertTrue(Book.objects.count() == 11)
+            self.assertTrue(Book.objects.filter(title="x").count() == 0)
+
+            # only the changed rows are journaled (the tables are not 
+            # copied), nested blocks are undone up to their start
+            try:
+                with db.atomic():
+                    Book(title="y", pages=1).save()
+                    self.assertTrue(len(MemoryTable.journal) == 1)
+                    try:
+                        with db.atomic():
+                            b = Book.objects.get(rowid=3)
+                            b.pages = 20
+                            b.save()
+                            b.destroy()
+                            Author(name="0").save()
+                    except IntegrityError:
+                        pass
+                    self.assertTrue(Book.objects.get(rowid=3).pages == 2)
+                    Book.objects.get(rowid=4).destroy()
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.assertTrue(MemoryTable.journal is None)
+            self.assertTrue(Book.objects.count() == 11)
+            self.assertTrue(Book.objects.get(title="b3").pages == 3)
+            self.assertTrue(len(Book.objects.filter(author=authors[2])) == 3)
+            self.assertTrue(Book(title="z").save() and \
+                    Book.objects.get(title="z").rowid == 13)
+            Book.objects.get(title="z").destroy()
+
+            objs = [Author(name="a"), Author(name="0")]
+            self.assertRaises(IntegrityError, 
+                    Author.objects.bulk_create, objs)
+            self.assertTrue(all(a.rowid is None and a.dirty for a in objs))
+        finally:
+            db.reset()
+
+    def test_memory_database_constraints(self):
+        db = MemoryDatabase()
+
+        class Book(BaseRecord):
+            database = db
+            title = StringField(size=40, required=True, default=None)
+            isbn = StringField(size=20, default=None)
+            shelf = IntegerField(default=None)
+            pos = IntegerField(default=None)
+            indexes = [Index("isbn", unique=True), 
+                    Index("shelf", "-pos", unique=True)]
+
+        try:
+            db.create_tables()
+            Book(title="a", isbn="1", shelf=1, pos=1).save()
+            Book(title="b", shelf=1, pos=2).save()
+            Book(title="c", shelf=1).save()
+            Book(title="d", shelf=1).save()
+            
+            # the same constraints as in sqlite
+            for kw in ({"title": "x", "isbn": "1"}, {"title": "x", "shelf": 1,
+                    "pos": 2}):
+                self.assertRaises(IntegrityError, Book(**kw).save)
+            self.assertRaises(IntegrityError, 
+                    lambda: db.insert_rows(Book, ["isbn"], [("9",)]))
+            b = Book.objects.get(title="b")
+            b.pos = 1
+            self.assertRaises(IntegrityError, b.save)
+            b.pos, b.shelf = 1, 2
+            b.save()
+            self.assertTrue(Book.objects.count() == 4)
+            self.assertTrue(Book.objects.one(shelf=1) is None)
+        finally:
+            db.reset()
+
+        class Edition(BaseRecord):
+            database = db
+            isbn = StringField(size=20)
+            indexes = [Index("isbn", unique=True, where="isbn <> ''")]
+        
+        try:
+            self.assertRaises(MemoryDatabaseError, db.create_tables)
+        finally:
+            db.reset()
+
+    def test_memory_database_reset(self):
+        db = MemoryDatabase()
+
+        class Book(BaseRecord):
+            database = db
+            title = StringField(size=40)
+
+        try:
+            db.create_tables()
+            Book(title="a").save()
+            db.reset()
+            self.assertTrue(db.contributed_records == [] and db.tables == {})
+            
+            # a new record class gets a new table
+            class Book(BaseRecord):
+                database = db
+                pages = IntegerField()
+            
+            db.create_tables()
+            self.assertTrue(db.table(Book).columns == ("rowid", "pages"))
+            self.assertTrue(Book.objects.count() == 0)
+        finally:
+            db.reset()
+ 
+if __name__ == '__main__':
+    unittest.main()